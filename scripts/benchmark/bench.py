@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Load generator and benchmark harness for the Embeddings and Reranker services
+
+Drives a running service over HTTP (--url) or the FastAPI app in-process through
+httpx's ASGITransport (--in-process), sweeping concurrency x batch size over a
+configurable text-length distribution. Reports req/s, texts/s, tokens/s and
+latency percentiles per scenario and writes them as JSON for comparing commits.
+
+    python bench.py embeddings --url http://localhost:8082 --concurrency 1,8,32 --batch-sizes 1,16,64
+    python bench.py reranker --in-process --tiny-model --batch-sizes 10,100
+    python bench.py compare results/base.json results/head.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from tiny_models import WORDS, tiny_model
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger("bench")
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+SERVICES = {
+    "embeddings": {"path": "/v1/embeddings", "default_url": "http://localhost:8082"},
+    "reranker": {"path": "/v1/rerank", "default_url": "http://localhost:8083"},
+}
+
+
+def parse_ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def parse_lengths(value: str) -> Tuple[List[int], List[float]]:
+    """'16:0.5,128:0.4,480:0.1' -> word counts and their sampling weights (weights default to 1)"""
+    lengths, weights = [], []
+    for item in value.split(","):
+        length, _, weight = item.partition(":")
+        lengths.append(int(length))
+        weights.append(float(weight) if weight else 1.0)
+    return lengths, weights
+
+
+class Workload:
+    """Seeded text generator with a word-count distribution and an optional duplicate rate"""
+
+    def __init__(self, lengths: List[int], weights: List[float], duplicate_rate: float = 0.0, seed: int = 0):
+        self.lengths = lengths
+        self.weights = weights
+        self.duplicate_rate = duplicate_rate
+        self.rng = random.Random(seed)
+        self.sent: List[str] = []
+
+    def text(self, length: Optional[int] = None) -> str:
+        if self.sent and self.rng.random() < self.duplicate_rate:
+            return self.rng.choice(self.sent)
+        length = length or self.rng.choices(self.lengths, self.weights)[0]
+        text = " ".join(self.rng.choices(WORDS, k=length))
+        self.sent.append(text)
+        return text
+
+    def texts(self, count: int) -> List[str]:
+        return [self.text() for _ in range(count)]
+
+
+def build_payload(service: str, workload: Workload, batch_size: int, query_words: int,
+                  params: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """One request body and the number of texts it carries"""
+    if service == "embeddings":
+        payload = {"input": workload.texts(batch_size)}
+    else:
+        payload = {"query": workload.text(query_words), "documents": workload.texts(batch_size),
+                   "return_documents": False}
+    payload.update(params)
+    return payload, batch_size
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {}
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "mean": round(float(ms.mean()), 2),
+        "max": round(float(ms.max()), 2),
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, service: str, workload: Workload, concurrency: int,
+                       batch_size: int, requests: int, warmup: int, query_words: int,
+                       params: Dict[str, Any]) -> Dict[str, Any]:
+    """Send ``requests`` bodies through ``concurrency`` workers and summarise the timed part"""
+    path = SERVICES[service]["path"]
+    # Build every body up front so text generation is not timed
+    payloads = [build_payload(service, workload, batch_size, query_words, params) for _ in range(warmup + requests)]
+    for payload, _ in payloads[:warmup]:
+        await client.post(path, json=payload)
+
+    pending = iter(payloads[warmup:])
+    latencies: List[float] = []
+    texts = tokens = errors = 0
+    first_error = None
+
+    async def worker():
+        nonlocal texts, tokens, errors, first_error
+        for payload, count in pending:
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload)
+                elapsed = time.perf_counter() - started
+                if response.status_code != 200:
+                    raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+                usage = response.json().get("usage") or {}
+            except Exception as e:
+                errors += 1
+                first_error = first_error or str(e)
+                continue
+            latencies.append(elapsed)
+            texts += count
+            tokens += int(usage.get("total_tokens", 0))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+
+    result = {
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "req_per_s": round(len(latencies) / seconds, 2),
+        "texts_per_s": round(texts / seconds, 2),
+        "tokens_per_s": round(tokens / seconds, 2),
+        "latency_ms": latency_summary(latencies),
+    }
+    if first_error:
+        result["first_error"] = first_error
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_in_process_app(service: str, args):
+    """Import the service's FastAPI app in this process, pointing it at a tiny model if asked"""
+    cache_dir = Path(args.cache_dir).expanduser()
+    os.environ.setdefault("CACHE_DIR", str(cache_dir))
+    os.environ.setdefault("DEVICE", "cpu")
+    if args.tiny_model:
+        os.environ["MODEL_NAME"] = str(tiny_model(service, cache_dir))
+        os.environ.setdefault("MAX_LENGTH", "512")
+    elif args.model:
+        os.environ["MODEL_NAME"] = args.model
+    # Both services use top-level module names (server, metrics, ...), so only one can be imported per run
+    sys.path.insert(0, str(REPO_ROOT / "services" / service))
+    import server
+    return server.app
+
+
+async def benchmark(args) -> Dict[str, Any]:
+    service = args.service
+    lengths, weights = parse_lengths(args.lengths)
+    workload = Workload(lengths, weights, args.duplicate_rate, args.seed)
+    params = json.loads(args.params) if args.params else {}
+    if args.model and not args.in_process:
+        params.setdefault("model", args.model)
+
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=max(parse_ints(args.concurrency)))
+    if args.in_process:
+        app = load_in_process_app(service, args)
+        # ASGITransport does not run startup handlers (the embeddings batcher), so enter the lifespan here
+        lifespan = app.router.lifespan_context(app)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=timeout)
+        target = "in-process"
+    else:
+        lifespan = None
+        url = args.url or SERVICES[service]["default_url"]
+        client = httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits)
+        target = url
+
+    scenarios = []
+    if lifespan is not None:
+        await lifespan.__aenter__()
+    try:
+        async with client:
+            health = (await client.get("/health")).json()
+            for concurrency in parse_ints(args.concurrency):
+                for batch_size in parse_ints(args.batch_sizes):
+                    result = await run_scenario(client, service, workload, concurrency, batch_size,
+                                                args.requests, args.warmup, args.query_words, params)
+                    scenarios.append(result)
+                    latency = result["latency_ms"]
+                    logger.info(
+                        f"c={concurrency:<4} batch={batch_size:<5} {result['req_per_s']:>9.2f} req/s "
+                        f"{result['texts_per_s']:>10.2f} texts/s {result['tokens_per_s']:>11.2f} tok/s  "
+                        f"p50 {latency.get('p50', 0):>8.2f}  p95 {latency.get('p95', 0):>8.2f}  "
+                        f"p99 {latency.get('p99', 0):>8.2f} ms  errors {result['errors']}"
+                    )
+    finally:
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    return {
+        "service": service,
+        "target": target,
+        "model": health.get("model"),
+        "device": health.get("device"),
+        "commit": git_commit(),
+        "host": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "started_at": datetime.now().isoformat(),
+        "workload": {
+            "lengths": dict(zip(lengths, weights)),
+            "duplicate_rate": args.duplicate_rate,
+            "query_words": args.query_words if service == "reranker" else None,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "params": params,
+        },
+        "scenarios": scenarios,
+    }
+
+
+def compare(baseline_path: str, candidate_path: str, threshold: float) -> int:
+    """Print per-scenario throughput and p95 ratios; exit non-zero if any scenario regressed past threshold"""
+    baseline = json.loads(Path(baseline_path).read_text())
+    candidate = json.loads(Path(candidate_path).read_text())
+    before = {(s["concurrency"], s["batch_size"]): s for s in baseline["scenarios"]}
+    logger.info(f"{baseline.get('commit')} -> {candidate.get('commit')} ({candidate['service']}, {candidate.get('model')})")
+
+    regressions = 0
+    for scenario in candidate["scenarios"]:
+        key = (scenario["concurrency"], scenario["batch_size"])
+        old = before.get(key)
+        if old is None or not old["tokens_per_s"] or not old["latency_ms"]:
+            continue
+        throughput = scenario["tokens_per_s"] / old["tokens_per_s"]
+        p95 = scenario["latency_ms"].get("p95", 0) / old["latency_ms"]["p95"]
+        regressed = throughput < 1 - threshold or p95 > 1 + threshold
+        regressions += regressed
+        logger.info(f"c={key[0]:<4} batch={key[1]:<5} tokens/s x{throughput:.2f}  p95 x{p95:.2f}"
+                    f"{'  REGRESSION' if regressed else ''}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="service", required=True)
+
+    for service in SERVICES:
+        run = commands.add_parser(service, help=f"Benchmark the {service} service")
+        target = run.add_mutually_exclusive_group()
+        target.add_argument("--url", help=f"Base URL of a running service (default {SERVICES[service]['default_url']})")
+        target.add_argument("--in-process", action="store_true", help="Import the FastAPI app and drive it via ASGITransport")
+        run.add_argument("--tiny-model", action="store_true", help="In-process: serve a tiny random model (no downloads)")
+        run.add_argument("--model", help="Model name (in-process: MODEL_NAME; over HTTP: the request's model field)")
+        run.add_argument("--cache-dir", default="~/.cache/uc1-bench", help="In-process CACHE_DIR and tiny model location")
+        run.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrent client counts")
+        run.add_argument("--batch-sizes", default="1,16,64" if service == "embeddings" else "10,50,200",
+                         help="Comma-separated texts (embeddings) or documents (reranker) per request")
+        run.add_argument("--lengths", default="16:0.4,64:0.4,256:0.2",
+                         help="Word-count distribution as length:weight pairs")
+        run.add_argument("--query-words", type=int, default=12, help="Reranker query length in words")
+        run.add_argument("--duplicate-rate", type=float, default=0.0,
+                         help="Fraction of texts repeated from earlier requests (exercises caches)")
+        run.add_argument("--requests", type=int, default=100, help="Timed requests per scenario")
+        run.add_argument("--warmup", type=int, default=4, help="Untimed requests before each scenario")
+        run.add_argument("--params", help="Extra JSON merged into every request body")
+        run.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+        run.add_argument("--seed", type=int, default=0)
+        run.add_argument("--output", help="Result file (default benchmark-results/<service>-<commit>-<time>.json)")
+
+    diff = commands.add_parser("compare", help="Compare two result files scenario by scenario")
+    diff.add_argument("baseline")
+    diff.add_argument("candidate")
+    diff.add_argument("--threshold", type=float, default=0.1, help="Relative change that counts as a regression")
+
+    args = parser.parse_args()
+    if args.service == "compare":
+        sys.exit(compare(args.baseline, args.candidate, args.threshold))
+    if args.tiny_model and not args.in_process:
+        parser.error("--tiny-model requires --in-process")
+
+    results = asyncio.run(benchmark(args))
+    output = Path(args.output) if args.output else Path("benchmark-results") / (
+        f"{args.service}-{results['commit'] or 'nogit'}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    logger.info(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Tiny randomly initialised models for benchmarking without downloading weights
+Builds a 2-layer BERT bi-encoder and cross-encoder on a word-level vocabulary, saved once under a cache directory
+"""
+
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+
+# Shared with the load generator so generated text tokenizes to one token per word
+WORDS = (
+    "the model maps text into vectors so that related passages land close together while unrelated "
+    "ones stay apart which lets retrieval systems rank documents by meaning rather than exact wording "
+    "a query asks about some topic and every candidate passage is scored against it before the best "
+    "few are returned to the caller along with their position in the original list of results"
+).split()
+VOCAB = sorted(set(WORDS))
+
+
+def _config(num_labels: int = 1):
+    from transformers import BertConfig
+    return BertConfig(
+        vocab_size=len(SPECIAL_TOKENS) + len(VOCAB),
+        hidden_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=128,
+        max_position_embeddings=512,
+        num_labels=num_labels,
+    )
+
+
+def _tokenizer(directory: Path):
+    from transformers import BertTokenizerFast
+    vocab_file = directory / "vocab.txt"
+    vocab_file.write_text("\n".join(SPECIAL_TOKENS + VOCAB) + "\n")
+    return BertTokenizerFast(vocab_file=str(vocab_file), do_lower_case=True, model_max_length=512)
+
+
+def build_embedding_model(directory: Path) -> Path:
+    """SentenceTransformer directory (BERT + mean pooling), loadable by MODEL_NAME=<path>"""
+    if (directory / "modules.json").exists():
+        return directory
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertModel
+
+    logger.info(f"Building tiny embedding model in {directory}")
+    torch.manual_seed(0)
+    encoder_dir = directory / "encoder"
+    encoder_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = _tokenizer(encoder_dir)
+    BertModel(_config()).save_pretrained(encoder_dir)
+    tokenizer.save_pretrained(encoder_dir)
+
+    transformer = models.Transformer(str(encoder_dir), max_seq_length=512)
+    pooling = models.Pooling(transformer.get_word_embedding_dimension(), pooling_mode="mean")
+    SentenceTransformer(modules=[transformer, pooling], device="cpu").save(str(directory))
+    return directory
+
+
+def build_reranker_model(directory: Path) -> Path:
+    """Single-logit BERT sequence classifier directory, loadable by CrossEncoder"""
+    if (directory / "config.json").exists():
+        return directory
+    import torch
+    from transformers import BertForSequenceClassification
+
+    logger.info(f"Building tiny reranker model in {directory}")
+    torch.manual_seed(0)
+    directory.mkdir(parents=True, exist_ok=True)
+    tokenizer = _tokenizer(directory)
+    BertForSequenceClassification(_config(num_labels=1)).save_pretrained(directory)
+    tokenizer.save_pretrained(directory)
+    return directory
+
+
+BUILDERS = {
+    "embeddings": build_embedding_model,
+    "reranker": build_reranker_model,
+}
+
+
+def tiny_model(service: str, cache_dir: Path) -> Path:
+    """Path to the tiny model for a service, building it on first use"""
+    return BUILDERS[service](Path(cache_dir) / f"tiny-{service}")
@@ -0,0 +1,156 @@
+"""
+Dynamic micro-batching for the Embeddings Service
+Coalesces texts from concurrent requests into shared encode() calls
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set
+
+from metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingRequest:
+    __slots__ = ("texts", "key", "future", "queued_at")
+
+    def __init__(self, texts: List[str], key: Hashable, future: asyncio.Future, queued_at: float):
+        self.texts = texts
+        self.key = key
+        self.future = future
+        self.queued_at = queued_at
+
+
+class EmbeddingBatcher:
+    """Gather texts from concurrent callers and encode them in one batch.
+
+    Requests are queued and a single worker task drains the queue, waiting at
+    most ``max_wait_ms`` for more texts once the first request arrives or
+    until ``max_batch_size`` texts are collected. Only requests sharing the
+    same ``key`` are encoded together. The forward pass runs on a dedicated
+    worker thread so the event loop keeps serving /health and friends.
+    ``encode_fn`` may return any sliceable result with one row per text.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str], Hashable], Any],
+                 max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Future] = set()
+        self.stats = {"requests": 0, "batches": 0, "texts": 0}
+
+    async def start(self):
+        """Start the background worker on the running event loop"""
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+            logger.info(f"Batcher started (max_batch_size={self.max_batch_size}, "
+                        f"max_wait_ms={self.max_wait_ms})")
+
+    async def stop(self):
+        """Stop the worker and release the encode thread"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, texts: List[str], key: Hashable = None):
+        """Queue texts for encoding and wait for their slice of the batch result"""
+        await self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        await self._queue.put(_PendingRequest(texts, key, future, loop.time()))
+        self.stats["requests"] += 1
+        return await future
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait for every request submitted so far to finish; later submissions are not waited on"""
+        pending = [future for future in self._pending if not future.done()]
+        if not pending:
+            return True
+        _, still_pending = await asyncio.wait(pending, timeout=timeout)
+        return not still_pending
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Report batching configuration and counters"""
+        batches = self.stats["batches"]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "in_flight": len(self._pending),
+            "requests": self.stats["requests"],
+            "batches": batches,
+            "texts": self.stats["texts"],
+            "avg_batch_size": round(self.stats["texts"] / batches, 2) if batches else 0,
+        }
+
+    async def _collect(self) -> List[_PendingRequest]:
+        """Wait for one request, then gather more until the batch is full or the wait expires"""
+        loop = asyncio.get_running_loop()
+        first = await self._queue.get()
+        batch = [first]
+        size = len(first.texts)
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while size < self.max_batch_size:
+            if not self._queue.empty():
+                item = self._queue.get_nowait()
+            else:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            batch.append(item)
+            size += len(item.texts)
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+
+            # Only encode together what can share a forward pass
+            groups: Dict[Hashable, List[_PendingRequest]] = {}
+            for item in batch:
+                if not item.future.done():  # skip callers that went away
+                    groups.setdefault(item.key, []).append(item)
+
+            for key, items in groups.items():
+                texts = [text for item in items for text in item.texts]
+                dispatched = loop.time()
+                for item in items:
+                    observe_stage("queue", dispatched - item.queued_at)
+                try:
+                    result = await loop.run_in_executor(self.executor, self.encode_fn, texts, key)
+                except Exception as e:
+                    logger.error(f"Batch encode failed for {len(texts)} text(s): {e}")
+                    for item in items:
+                        if not item.future.done():
+                            item.future.set_exception(e)
+                    continue
+
+                self.stats["batches"] += 1
+                self.stats["texts"] += len(texts)
+
+                # Hand each caller its slice of the batch
+                offset = 0
+                for item in items:
+                    count = len(item.texts)
+                    if not item.future.done():
+                        item.future.set_result(result[offset:offset + count])
+                    offset += count
@@ -0,0 +1,270 @@
+"""
+Content-addressed embedding cache for the Embeddings Service
+In-memory LRU with a byte budget and TTL, optionally backed by Redis or an on-disk store
+"""
+
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import struct
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost (key, tuple, ndarray header) on top of the vector itself
+ENTRY_OVERHEAD = 160
+
+# Stored blobs carry the token count and truncation flag ahead of the float32 vector
+_HEADER = struct.Struct("<I?")
+# Bump when the blob layout or key scheme changes so persisted entries in the old format are never read
+CACHE_FORMAT = "v2"
+
+
+class CachedEmbedding(tuple):
+    """(vector, token_count, truncated) for one cached text"""
+
+    __slots__ = ()
+
+    def __new__(cls, vector: np.ndarray, token_count: int, truncated: bool):
+        return super().__new__(cls, (vector, token_count, truncated))
+
+    @property
+    def vector(self) -> np.ndarray:
+        return self[0]
+
+    @property
+    def token_count(self) -> int:
+        return self[1]
+
+    @property
+    def truncated(self) -> bool:
+        return self[2]
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(self.token_count, self.truncated) + self.vector.tobytes()
+
+    @classmethod
+    def from_bytes(cls, value: bytes) -> "CachedEmbedding":
+        token_count, truncated = _HEADER.unpack_from(value)
+        return cls(np.frombuffer(value, dtype=np.float32, offset=_HEADER.size), token_count, truncated)
+
+
+def make_cache_key(model_name: str, runtime: str, normalize: bool, max_length: int, prefix: str, text: str) -> str:
+    """Build a content address for one text under the settings that shape its vector"""
+    digest = hashlib.blake2b(digest_size=20)
+    for part in (model_name, runtime, "1" if normalize else "0", str(max_length), prefix):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _RedisStore:
+    """Backing store on the unicorn-redis container"""
+
+    def __init__(self, url: str, ttl: int, namespace: str = f"emb:{CACHE_FORMAT}:"):
+        import redis.asyncio as redis  # optional dependency
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.namespace = namespace
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return await self.client.mget([self.namespace + key for key in keys])
+
+    async def put_many(self, items: Dict[str, bytes]):
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(self.namespace + key, value, ex=self.ttl or None)
+        await pipe.execute()
+
+    async def clear(self):
+        async for key in self.client.scan_iter(match=self.namespace + "*", count=1000):
+            await self.client.delete(key)
+
+
+class _DiskStore:
+    """Backing store in a local SQLite file under the cache dir"""
+
+    TABLE = f"embeddings_{CACHE_FORMAT}"
+
+    def __init__(self, path: Path, ttl: int):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.TABLE} (key TEXT PRIMARY KEY, value BLOB, expires REAL)"
+        )
+        self.lock = asyncio.Lock()
+
+    def _get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        found = {}
+        now = time.time()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, value, expires FROM {self.TABLE} WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            for key, value, expires in rows:
+                if not expires or expires > now:
+                    found[key] = value
+        return [found.get(key) for key in keys]
+
+    def _put_many(self, items: Dict[str, bytes]):
+        expires = time.time() + self.ttl if self.ttl else 0
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {self.TABLE} (key, value, expires) VALUES (?, ?, ?)",
+                [(key, value, expires) for key, value in items.items()]
+            )
+
+    def _clear(self):
+        with self.conn:
+            self.conn.execute(f"DELETE FROM {self.TABLE}")
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        async with self.lock:
+            return await asyncio.to_thread(self._get_many, keys)
+
+    async def put_many(self, items: Dict[str, bytes]):
+        async with self.lock:
+            await asyncio.to_thread(self._put_many, items)
+
+    async def clear(self):
+        async with self.lock:
+            await asyncio.to_thread(self._clear)
+
+
+class EmbeddingCache:
+    """Two-tier cache: an in-memory LRU in front of an optional Redis or disk store"""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl: int = 0,
+                 backend: str = "memory", redis_url: Optional[str] = None,
+                 disk_path: Optional[Path] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.backend = backend
+        self.enabled = max_bytes > 0 or backend != "memory"
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.bytes_used = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "store_hits": 0}
+        self.store = None
+
+        try:
+            if backend == "redis":
+                self.store = _RedisStore(redis_url or "redis://unicorn-redis:6379/0", ttl)
+            elif backend == "disk":
+                self.store = _DiskStore(disk_path or Path("embedding_cache.sqlite3"), ttl)
+        except Exception as e:
+            logger.warning(f"Embedding cache backend '{backend}' unavailable, using memory only: {e}")
+            self.backend = "memory"
+            self.store = None
+
+    def _get_local(self, key: str) -> Optional[CachedEmbedding]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, cached = entry
+        if expires and expires < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return cached
+
+    def _put_local(self, key: str, cached: CachedEmbedding):
+        if self.max_bytes <= 0:
+            return
+        if key in self._entries:
+            self._remove(key)
+        expires = time.monotonic() + self.ttl if self.ttl else 0
+        self._entries[key] = (expires, cached)
+        self.bytes_used += cached.vector.nbytes + ENTRY_OVERHEAD
+        while self.bytes_used > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        _, cached = self._entries.pop(key)
+        self.bytes_used -= cached.vector.nbytes + ENTRY_OVERHEAD
+
+    async def get_many(self, keys: List[str]) -> List[Optional[CachedEmbedding]]:
+        """Look up entries in order; misses are returned as None"""
+        if not self.enabled:
+            self.stats["misses"] += len(keys)
+            return [None] * len(keys)
+
+        results = [self._get_local(key) for key in keys]
+
+        if self.store is not None:
+            missing = [i for i, vector in enumerate(results) if vector is None]
+            if missing:
+                try:
+                    values = await self.store.get_many([keys[i] for i in missing])
+                except Exception as e:
+                    logger.warning(f"Embedding cache store lookup failed: {e}")
+                    values = [None] * len(missing)
+                for i, value in zip(missing, values):
+                    if value is not None:
+                        cached = CachedEmbedding.from_bytes(value)
+                        results[i] = cached
+                        self._put_local(keys[i], cached)
+                        self.stats["store_hits"] += 1
+
+        hits = sum(1 for cached in results if cached is not None)
+        self.stats["hits"] += hits
+        self.stats["misses"] += len(keys) - hits
+        return results
+
+    async def put_many(self, keys: List[str], vectors: np.ndarray,
+                       token_counts: np.ndarray, truncated: np.ndarray):
+        """Store freshly encoded vectors with their token accounting (one row per key)"""
+        if not self.enabled or not keys:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        entries = [
+            CachedEmbedding(vector.copy(), int(count), bool(flag))
+            for vector, count, flag in zip(vectors, token_counts, truncated)
+        ]
+        for key, cached in zip(keys, entries):
+            self._put_local(key, cached)
+        if self.store is not None:
+            try:
+                await self.store.put_many({key: cached.to_bytes() for key, cached in zip(keys, entries)})
+            except Exception as e:
+                logger.warning(f"Embedding cache store write failed: {e}")
+
+    async def clear(self):
+        """Drop every cached vector, e.g. after a model or settings change"""
+        self._entries.clear()
+        self.bytes_used = 0
+        if self.store is not None:
+            try:
+                await self.store.clear()
+            except Exception as e:
+                logger.warning(f"Embedding cache store clear failed: {e}")
+        logger.info("Embedding cache invalidated")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Report hit rate, memory use and evictions"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend,
+            "entries": len(self._entries),
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.stats["hits"],
+            "misses": self.stats["misses"],
+            "store_hits": self.stats["store_hits"],
+            "evictions": self.stats["evictions"],
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
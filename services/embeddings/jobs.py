@@ -0,0 +1,357 @@
+"""
+Async bulk embedding jobs for the Embeddings Service
+Chunks a JSONL or text file, embeds it through the batching engine and upserts into Qdrant,
+checkpointing progress so a restarted service resumes where it left off
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import aclosing
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATES = ("queued", "running")
+
+
+def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """Split text into overlapping windows of chunk_size words; the last window always ends at the final word"""
+    words = text.split()
+    if len(words) <= chunk_size:
+        return [text] if words else []
+    step = chunk_size - overlap
+    starts = list(range(0, len(words) - chunk_size, step)) + [len(words) - chunk_size]
+    return [" ".join(words[start:start + chunk_size]) for start in starts]
+
+
+class QdrantWriter:
+    """Pooled HTTP client for batch upserts into unicorn-qdrant"""
+
+    def __init__(self, url: str, api_key: Optional[str] = None, timeout: float = 60.0):
+        headers = {"api-key": api_key} if api_key else {}
+        self.client = httpx.AsyncClient(
+            base_url=url,
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+        )
+
+    async def ensure_collection(self, name: str, size: int, distance: str = "Cosine"):
+        response = await self.client.get(f"/collections/{name}")
+        if response.status_code == 404:
+            logger.info(f"Creating Qdrant collection {name} (size={size}, distance={distance})")
+            response = await self.client.put(f"/collections/{name}", json={
+                "vectors": {"size": size, "distance": distance}
+            })
+        response.raise_for_status()
+
+    async def upsert(self, collection: str, ids: List[str], vectors: np.ndarray, payloads: List[dict]):
+        points = [
+            {"id": point_id, "vector": vector, "payload": payload}
+            for point_id, vector, payload in zip(ids, vectors.tolist(), payloads)
+        ]
+        response = await self.client.put(
+            f"/collections/{collection}/points", params={"wait": "true"}, json={"points": points}
+        )
+        response.raise_for_status()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class EmbeddingJob:
+    """State of one bulk job, persisted as JSON after every committed batch"""
+
+    def __init__(self, job_id: str, source: str, collection: str, **options):
+        self.id = job_id
+        self.source = source
+        self.collection = collection
+        self.model: Optional[str] = options.get("model")
+        self.batch_size = int(options.get("batch_size", 256))
+        self.chunk_size = int(options.get("chunk_size", 256))
+        self.chunk_overlap = int(options.get("chunk_overlap", 32))
+        if self.batch_size <= 0 or self.chunk_size <= 0:
+            raise ValueError("batch_size and chunk_size must be positive")
+        if not 0 <= self.chunk_overlap < self.chunk_size:
+            raise ValueError("chunk_overlap must be at least 0 and less than chunk_size")
+        self.status = options.get("status", "queued")
+        self.error: Optional[str] = options.get("error")
+        self.offset = int(options.get("offset", 0))  # byte offset of the next unprocessed line
+        self.records_done = int(options.get("records_done", 0))
+        self.chunks_done = int(options.get("chunks_done", 0))
+        self.skipped = int(options.get("skipped", 0))  # malformed or non-object input lines
+        self.total_bytes = int(options.get("total_bytes", 0))
+        self.created_at = options.get("created_at", time.time())
+        self.finished_at = options.get("finished_at")
+        # Throughput is measured from the current (re)start only
+        self._started = time.time()
+        self._start_offset = self.offset
+        self._start_chunks = self.chunks_done
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "source": self.source,
+            "collection": self.collection,
+            "model": self.model,
+            "batch_size": self.batch_size,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "status": self.status,
+            "error": self.error,
+            "offset": self.offset,
+            "records_done": self.records_done,
+            "chunks_done": self.chunks_done,
+            "skipped": self.skipped,
+            "total_bytes": self.total_bytes,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        """Progress, throughput and ETA for GET /jobs/{id}"""
+        elapsed = max(time.time() - self._started, 1e-6)
+        bytes_per_second = (self.offset - self._start_offset) / elapsed
+        chunks_per_second = (self.chunks_done - self._start_chunks) / elapsed
+        remaining = max(self.total_bytes - self.offset, 0)
+        eta = remaining / bytes_per_second if self.status == "running" and bytes_per_second > 0 else None
+        return {
+            **self.to_dict(),
+            "progress": round(self.offset / self.total_bytes, 4) if self.total_bytes else 0.0,
+            "chunks_per_second": round(chunks_per_second, 2) if self.status == "running" else None,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        }
+
+
+class JobManager:
+    """Runs bulk embedding jobs as background tasks with checkpoint/resume"""
+
+    def __init__(self, jobs_dir: Path, embed_fn: Callable[[Optional[str], List[str]], Awaitable[np.ndarray]],
+                 qdrant: QdrantWriter, max_concurrent: int = 1, import_root: Path = Path("/data")):
+        self.jobs_dir = jobs_dir
+        self.import_root = import_root
+        self.embed_fn = embed_fn
+        self.qdrant = qdrant
+        self.jobs: Dict[str, EmbeddingJob] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.slots = asyncio.Semaphore(max_concurrent)
+        self.closing = False
+        self._checkpoint_lock = threading.Lock()
+
+    def _state_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.json"
+
+    def _checkpoint(self, job: EmbeddingJob):
+        path = self._state_path(job.id)
+        tmp = path.with_suffix(".tmp")
+        # A cancelled commit may still be writing on its thread; serialize so the latest state lands last
+        with self._checkpoint_lock:
+            tmp.write_text(json.dumps(job.to_dict()))
+            tmp.replace(path)  # atomic, so a crash never leaves a torn checkpoint
+
+    async def _save(self, job: EmbeddingJob):
+        await asyncio.to_thread(self._checkpoint, job)
+
+    def upload_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.jsonl"
+
+    def new_job_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def import_path(self, source: str) -> Path:
+        """Resolve a client-supplied input path; it must stay under the import root"""
+        root = self.import_root.resolve()
+        path = (root / source).resolve()
+        if not path.is_relative_to(root):
+            raise ValueError(f"Input files must be under {self.import_root}")
+        return path
+
+    async def save_upload(self, job_id: str, upload) -> Path:
+        """Persist a multipart upload so the job can resume after a restart"""
+        path = self.upload_path(job_id)
+        await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+        f = await asyncio.to_thread(open, path, "wb")
+        try:
+            with f:
+                while chunk := await upload.read(1024 * 1024):
+                    await asyncio.to_thread(f.write, chunk)
+        except BaseException:
+            await asyncio.to_thread(self.discard_upload, job_id)
+            raise
+        return path
+
+    def discard_upload(self, job_id: str):
+        self.upload_path(job_id).unlink(missing_ok=True)
+
+    def _create(self, source: Path, collection: str, job_id: Optional[str], options: Dict[str, Any]) -> EmbeddingJob:
+        if not source.is_file():
+            raise FileNotFoundError(f"Input file not found: {source}")
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        job = EmbeddingJob(job_id or self.new_job_id(), str(source), collection,
+                           total_bytes=source.stat().st_size, **options)
+        self._checkpoint(job)
+        return job
+
+    async def submit(self, source: Path, collection: str, job_id: Optional[str] = None, **options) -> EmbeddingJob:
+        """Create a job for an existing file and start it"""
+        job = await asyncio.to_thread(self._create, source, collection, job_id, options)
+        self.jobs[job.id] = job
+        self._start(job)
+        return job
+
+    def resume_all(self):
+        """Restart every job that was queued or running when the service stopped"""
+        if not self.jobs_dir.exists():
+            return
+        for state_path in sorted(self.jobs_dir.glob("*.json")):
+            try:
+                state = json.loads(state_path.read_text())
+                job = EmbeddingJob(state.pop("id"), state.pop("source"), state.pop("collection"), **state)
+            except Exception as e:
+                logger.warning(f"Skipping unreadable job checkpoint {state_path}: {e}")
+                continue
+            self.jobs[job.id] = job
+            if job.status in ACTIVE_STATES:
+                logger.info(f"Resuming job {job.id} at byte {job.offset}/{job.total_bytes}")
+                self._start(job)
+
+    def cancel(self, job_id: str) -> Optional[EmbeddingJob]:
+        job = self.jobs.get(job_id)
+        task = self.tasks.get(job_id)
+        if job is not None and task is not None and not task.done():
+            task.cancel()
+        return job
+
+    async def shutdown(self):
+        """Stop running jobs without marking them finished so they resume on restart"""
+        self.closing = True
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        await self.qdrant.close()
+
+    def _start(self, job: EmbeddingJob):
+        self.tasks[job.id] = asyncio.create_task(self._run(job))
+
+    def _read_batch(self, job: EmbeddingJob, f, is_jsonl: bool, line_number: int):
+        """Read up to batch_size records (runs on a worker thread).
+
+        Lines that are not valid JSON objects (or not UTF-8 text) are logged
+        and skipped, so one bad line cannot fail the job on every resume.
+        """
+        batch = []
+        skipped = 0
+        while len(batch) < job.batch_size:
+            line = f.readline()
+            if not line:
+                break
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line) if is_jsonl else {"text": line.decode("utf-8")}
+            except ValueError as e:
+                record = None
+                logger.warning(f"Job {job.id}: skipping line {line_number}: {e}")
+            if isinstance(record, dict):
+                record.setdefault("id", line_number)
+                batch.append(record)
+            else:
+                if record is not None:
+                    logger.warning(f"Job {job.id}: skipping line {line_number}: "
+                                   f"expected a JSON object, got {type(record).__name__}")
+                skipped += 1
+        return f.tell(), line_number, batch, skipped
+
+    async def _read_batches(self, job: EmbeddingJob):
+        """Yield (end_offset, line_number, records, skipped) batches of parsed input lines from the checkpoint"""
+        is_jsonl = job.source.endswith((".jsonl", ".ndjson"))
+        f = await asyncio.to_thread(open, job.source, "rb")
+        try:
+            await asyncio.to_thread(f.seek, job.offset)
+            line_number = job.records_done
+            while True:
+                end_offset, line_number, batch, skipped = await asyncio.to_thread(
+                    self._read_batch, job, f, is_jsonl, line_number
+                )
+                if batch or skipped:
+                    yield end_offset, line_number, batch, skipped
+                if len(batch) < job.batch_size:
+                    return
+        finally:
+            f.close()
+
+    def _chunk_records(self, job: EmbeddingJob, records: List[dict]):
+        ids, texts, payloads = [], [], []
+        for record in records:
+            text = record.get("text")
+            if not isinstance(text, str):
+                continue
+            metadata = record.get("metadata") or record.get("payload") or {}
+            for index, chunk in enumerate(chunk_text(text, job.chunk_size, job.chunk_overlap)):
+                # Deterministic ids make a resumed batch overwrite rather than duplicate points
+                ids.append(str(uuid.uuid5(uuid.NAMESPACE_URL, f"{job.collection}/{record['id']}/{index}")))
+                texts.append(chunk)
+                payloads.append({**metadata, "text": chunk, "source_id": record["id"], "chunk_index": index})
+        return ids, texts, payloads
+
+    async def _run(self, job: EmbeddingJob):
+        async with self.slots:
+            job.status = "running"
+            await self._save(job)
+            collection_ready = False
+            pending: Optional[asyncio.Task] = None
+            try:
+                async with aclosing(self._read_batches(job)) as batches:
+                    async for end_offset, line_number, records, skipped in batches:
+                        ids, texts, payloads = self._chunk_records(job, records)
+                        vectors = await self.embed_fn(job.model, texts) if texts else None
+
+                        # Upsert of the previous batch overlaps with embedding this one
+                        if pending is not None:
+                            await pending
+                        if vectors is not None and not collection_ready:
+                            await self.qdrant.ensure_collection(job.collection, vectors.shape[1])
+                            collection_ready = True
+                        pending = asyncio.create_task(
+                            self._commit(job, ids, vectors, payloads, end_offset, line_number, skipped)
+                        )
+                if pending is not None:
+                    await pending
+                job.status = "completed"
+                logger.info(f"Job {job.id} completed: {job.chunks_done} chunks into {job.collection}")
+            except asyncio.CancelledError:
+                if pending is not None:
+                    pending.cancel()
+                if self.closing:
+                    await self._save(job)  # stays active and resumes on restart
+                    raise
+                job.status = "cancelled"
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.status = "failed"
+                job.error = str(e)
+            job.finished_at = time.time()
+            await self._save(job)
+            # A finished job never reads its upload again
+            if Path(job.source) == self.upload_path(job.id):
+                await asyncio.to_thread(self.discard_upload, job.id)
+
+    async def _commit(self, job: EmbeddingJob, ids: List[str], vectors: Optional[np.ndarray],
+                      payloads: List[dict], end_offset: int, line_number: int, skipped: int = 0):
+        if vectors is not None:
+            await self.qdrant.upsert(job.collection, ids, vectors, payloads)
+        job.offset = end_offset
+        job.records_done = line_number
+        job.chunks_done += len(ids)
+        # Counted with the offset so a resumed job never counts the same bad line twice
+        job.skipped += skipped
+        await self._save(job)
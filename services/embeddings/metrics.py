@@ -0,0 +1,112 @@
+"""
+Prometheus metrics for the Embeddings Service
+Token accounting, per-stage latency, batch shape and cache effectiveness
+"""
+
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# From sub-millisecond cache hits up to long bulk batches on CPU
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_LATENCY = Histogram(
+    "embeddings_request_duration_seconds",
+    "End-to-end request latency",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS
+)
+STAGE_LATENCY = Histogram(
+    "embeddings_stage_duration_seconds",
+    "Time spent per pipeline stage (queue, tokenize, forward, postprocess, serialize)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    "embeddings_batch_size",
+    "Texts per forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+BATCH_TOKENS = Histogram(
+    "embeddings_batch_tokens",
+    "Padded tokens per forward pass",
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+)
+CACHE_LOOKUPS = Counter(
+    "embeddings_cache_lookups_total",
+    "Embedding cache lookups by result",
+    ["result"]
+)
+CACHE_HIT_RATIO = Gauge(
+    "embeddings_cache_hit_ratio",
+    "Embedding cache hits divided by lookups since start"
+)
+IN_FLIGHT = Gauge(
+    "embeddings_requests_in_flight",
+    "Embedding requests currently being served"
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "embeddings_model_load_seconds",
+    "Wall time of the most recent load of each model",
+    ["model"]
+)
+
+TOKENS = Counter(
+    "embeddings_prompt_tokens_total",
+    "Prompt tokens embedded, counted from the model tokenizer",
+    ["model", "source"]
+)
+INPUTS = Counter(
+    "embeddings_inputs_total",
+    "Input texts embedded",
+    ["model", "source"]
+)
+TRUNCATED = Counter(
+    "embeddings_truncated_inputs_total",
+    "Input texts truncated at the model's max sequence length",
+    ["model"]
+)
+
+
+def record_usage(model: str, result):
+    """Count tokens per model, split by texts that ran through the model vs. served from cache"""
+    encoded = result.padded_lengths > 0
+    for source, mask in (("encoded", encoded), ("cached", ~encoded)):
+        count = int(mask.sum())
+        if count:
+            INPUTS.labels(model, source).inc(count)
+            TOKENS.labels(model, source).inc(int(result.token_counts[mask].sum()))
+    truncated = int(result.truncated.sum())
+    if truncated:
+        TRUNCATED.labels(model).inc(truncated)
+
+
+def record_chunked_usage(model: str, inputs: int, tokens: int):
+    """Count long-document inputs; tokens include every window the model ran"""
+    INPUTS.labels(model, "encoded").inc(inputs)
+    TOKENS.labels(model, "encoded").inc(tokens)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_LATENCY.labels(stage).observe(seconds)
+
+
+def observe_batch(texts: int, padded_tokens: int):
+    """Record the shape of one forward pass"""
+    BATCH_SIZE.observe(texts)
+    BATCH_TOKENS.observe(padded_tokens)
+
+
+def record_cache_lookups(hits: int, misses: int):
+    if hits:
+        CACHE_LOOKUPS.labels("hit").inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels("miss").inc(misses)
+
+
+def bind_cache(cache):
+    """Read the hit ratio from the cache's own stats at scrape time"""
+    CACHE_HIT_RATIO.set_function(lambda: cache.get_stats()["hit_rate"])
+
+
+def metrics_response() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,181 @@
+"""
+Hugging Face model-cache inventory
+Indexes cached models once, persists sizes with directory mtimes and rescans only what changed
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "model_inventory.json"
+
+
+def folder_signature(folder: Path) -> List[int]:
+    """mtimes of the directories a download or deletion touches (the folder, blobs, refs, each snapshot)"""
+    signature = []
+    for path in (folder, folder / "blobs", folder / "refs", folder / "snapshots"):
+        try:
+            signature.append(path.stat().st_mtime_ns)
+        except OSError:
+            signature.append(0)
+    try:
+        with os.scandir(folder / "snapshots") as snapshots:
+            signature.extend(sorted(entry.stat(follow_symlinks=False).st_mtime_ns for entry in snapshots))
+    except OSError:
+        pass
+    return signature
+
+
+def folder_size(folder: Path) -> int:
+    """Bytes on disk under a model folder; snapshot symlinks into blobs/ are not counted twice"""
+    size = 0
+    stack = [folder]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif entry.is_file(follow_symlinks=False):
+                        size += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            continue
+    return size
+
+
+class ModelInventory:
+    """Index of models in the HF cache, kept current by a periodic mtime check.
+
+    Reads never touch the filesystem. A background task compares the mtimes
+    of each model's cache directories against the persisted index and only
+    walks the folders that changed, so a cache of tens of GB costs a few
+    ``stat()`` calls per model per refresh.
+    """
+
+    def __init__(self, cache_dir: str, refresh_interval: float = 30.0):
+        self.cache_dir = cache_dir
+        self.refresh_interval = refresh_interval
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.refreshed_at = 0.0
+        self._load_index()
+
+    @property
+    def roots(self) -> List[Path]:
+        # Standard HF cache location first, then the alternative flat layout
+        return [Path(self.cache_dir) / "hub", Path(self.cache_dir)]
+
+    @property
+    def index_path(self) -> Path:
+        return Path(self.cache_dir) / INDEX_FILE
+
+    def _load_index(self):
+        try:
+            index = json.loads(self.index_path.read_text())
+            if index.get("cache_dir") == self.cache_dir:
+                self._models = {entry["name"]: entry for entry in index["models"]}
+        except (OSError, ValueError, KeyError):
+            self._models = {}
+
+    def _save_index(self):
+        try:
+            tmp = self.index_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"cache_dir": self.cache_dir, "models": list(self._models.values())}))
+            tmp.replace(self.index_path)
+        except OSError as e:
+            logger.warning(f"Could not persist model inventory: {e}")
+
+    def _discover(self) -> Dict[str, Path]:
+        folders: Dict[str, Path] = {}
+        for root in self.roots:
+            try:
+                with os.scandir(root) as entries:
+                    for entry in entries:
+                        if entry.name.startswith("models--") and entry.is_dir():
+                            name = entry.name.replace("models--", "").replace("--", "/")
+                            folders.setdefault(name, Path(entry.path))
+            except OSError:
+                continue
+        return folders
+
+    def refresh(self, force: bool = False) -> bool:
+        """Bring the index up to date, rescanning only folders whose mtimes moved"""
+        changed = False
+        models = dict(self._models) if not force else {}
+        folders = self._discover()
+        for name in set(models) - set(folders):
+            del models[name]
+            changed = True
+        for name, folder in folders.items():
+            signature = folder_signature(folder)
+            entry = models.get(name)
+            if entry is None or entry["path"] != str(folder) or entry["signature"] != signature:
+                models[name] = {"name": name, "path": str(folder), "size": folder_size(folder),
+                                "signature": signature, "scanned_at": time.time()}
+                changed = True
+
+        self._models = models
+        self.refreshed_at = time.time()
+        if changed:
+            self._save_index()
+        return changed
+
+    def models(self) -> List[Dict[str, Any]]:
+        return [{key: entry[key] for key in ("name", "path", "size")} for entry in self._models.values()]
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self._models.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._models
+
+    def forget(self, name: str):
+        """Drop a model right after deleting it, ahead of the next refresh"""
+        if self._models.pop(name, None) is not None:
+            self._save_index()
+
+    def set_cache_dir(self, cache_dir: str):
+        if cache_dir != self.cache_dir:
+            self.cache_dir = cache_dir
+            self._models = {}
+            self._load_index()
+            self.request_refresh()
+
+    def request_refresh(self):
+        """Refresh soon, e.g. after a model was downloaded"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                if await asyncio.to_thread(self.refresh):
+                    logger.info(f"Model inventory updated: {len(self._models)} cached model(s)")
+            except Exception as e:
+                logger.warning(f"Model inventory refresh failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,147 @@
+"""
+Multi-model residency pool for the Embeddings Service
+Keeps several SentenceTransformer models loaded under a RAM budget with LRU eviction
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResidentModel:
+    """A loaded model plus everything derived from it"""
+
+    def __init__(self, name: str, model, quantizer, load_seconds: float = 0.0):
+        self.name = name
+        self.model = model
+        self.quantizer = quantizer
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.nbytes = model_nbytes(model)
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    @property
+    def max_length(self) -> int:
+        """Effective token limit: the configured MAX_LENGTH clamped to the model's own window"""
+        return self.model.max_seq_length
+
+    @property
+    def runtime(self) -> str:
+        """What actually computes the vectors: torch, or the ONNX provider and precision"""
+        if not hasattr(self.model, "forward_padded"):
+            return "torch"
+        return f"onnx:{self.model.provider}:{'int8' if self.model.quantized else 'fp32'}"
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "dimensions": self.dimension,
+            "max_length": self.max_length,
+            "memory_mb": round(self.nbytes / (1024 * 1024), 1),
+            "load_seconds": round(self.load_seconds, 2),
+            "loaded_at": self.loaded_at,
+            "last_used": self.last_used,
+        }
+
+
+def model_nbytes(model) -> int:
+    """Approximate resident size from parameter and buffer storage"""
+    if hasattr(model, "nbytes"):  # ONNX sessions report their graph size
+        return model.nbytes
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return 0
+
+
+class ModelPool:
+    """LRU pool of resident models bounded by count and memory.
+
+    The pool never evicts a pinned model (the active one). Entries are only
+    swapped in and out under a lock, so readers on the encode thread always
+    see a fully loaded model.
+    """
+
+    def __init__(self, max_models: int = 2, max_bytes: int = 0):
+        self.max_models = max(1, max_models)
+        self.max_bytes = max_bytes
+        self._models: "OrderedDict[str, ResidentModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loading: Dict[str, str] = {}  # name -> "loading" | "failed: <reason>"
+        self.stats = {"loads": 0, "evictions": 0, "hits": 0}
+
+    def get(self, name: str) -> Optional[ResidentModel]:
+        """Return a resident model and mark it recently used"""
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None:
+                self._models.move_to_end(name)
+                entry.last_used = time.time()
+                self.stats["hits"] += 1
+            return entry
+
+    def peek(self, name: str) -> Optional[ResidentModel]:
+        """Return a resident model without touching LRU order or stats"""
+        with self._lock:
+            return self._models.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._models
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._models)
+
+    def add(self, entry: ResidentModel, pinned: Iterable[str] = ()) -> List[str]:
+        """Insert a freshly loaded model, evicting least recently used ones to fit"""
+        pinned = set(pinned) | {entry.name}
+        evicted = []
+        with self._lock:
+            self._models[entry.name] = entry
+            self._models.move_to_end(entry.name)
+            self.stats["loads"] += 1
+
+            def over_budget():
+                if len(self._models) > self.max_models:
+                    return True
+                used = sum(e.nbytes for e in self._models.values())
+                return bool(self.max_bytes) and used > self.max_bytes
+
+            for name in list(self._models):
+                if not over_budget():
+                    break
+                if name in pinned:
+                    continue
+                del self._models[name]
+                evicted.append(name)
+                self.stats["evictions"] += 1
+
+        for name in evicted:
+            logger.info(f"Evicted model from pool: {name}")
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = [entry.get_info() for entry in self._models.values()]
+        return {
+            "max_models": self.max_models,
+            "max_memory_mb": round(self.max_bytes / (1024 * 1024), 1),
+            "memory_mb": round(sum(e["memory_mb"] for e in entries), 1),
+            "resident": entries,
+            "loading": dict(self.loading),
+            **self.stats,
+        }
@@ -0,0 +1,175 @@
+"""
+ONNX Runtime / OpenVINO inference backend for the Embeddings Service
+Exports a SentenceTransformer once, optionally int8-quantizes it, and serves it on a tuned session
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+# Texts for the torch-vs-ONNX parity check on load
+PARITY_TEXTS = [
+    "search_query: how do vector databases work?",
+    "Embeddings map text to points in a high-dimensional space.",
+    "a",
+    "The quick brown fox jumps over the lazy dog. " * 20,
+]
+
+
+def default_thread_count() -> int:
+    """CPUs this container may actually run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class _SentenceEmbeddingGraph(torch.nn.Module):
+    """Transformer + pooling as one traceable module"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        features = self.model({"input_ids": input_ids, "attention_mask": attention_mask})
+        return features["sentence_embedding"]
+
+
+def export_onnx(model, path: Path):
+    """Export a SentenceTransformer (on CPU) to ONNX with dynamic batch and sequence axes"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    graph = _SentenceEmbeddingGraph(model).to("cpu").eval()
+    dummy = model.tokenizer(["export the embedding graph"], return_tensors="pt")
+    logger.info(f"Exporting ONNX graph to {path}")
+    with torch.inference_mode():
+        torch.onnx.export(
+            graph,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            str(path),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["sentence_embedding"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "sentence_embedding": {0: "batch"},
+            },
+            opset_version=17,
+            do_constant_folding=True,
+        )
+
+
+def quantize_onnx(source: Path, target: Path):
+    """Dynamic int8 weight quantization of an exported graph"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    logger.info(f"Quantizing ONNX graph to int8: {target}")
+    quantize_dynamic(str(source), str(target), weight_type=QuantType.QInt8)
+
+
+class OnnxSentenceEncoder:
+    """Serves an exported embedding graph with the SentenceTransformer surface the scheduler needs"""
+
+    def __init__(self, path: Path, tokenizer, max_seq_length: int, dimension: int,
+                 backend: str = "onnx", threads: int = 0, quantized: bool = False):
+        import onnxruntime as ort
+
+        self.path = path
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self.quantized = quantized
+        self.dimension = dimension
+        self.device = "cpu"
+        self.threads = threads or default_thread_count()
+        self.nbytes = path.stat().st_size
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        providers = ["CPUExecutionProvider"]
+        if backend == "openvino":
+            if "OpenVINOExecutionProvider" in ort.get_available_providers():
+                providers.insert(0, ("OpenVINOExecutionProvider", {
+                    "device_type": "CPU",
+                    "num_of_threads": self.threads,
+                    "cache_dir": str(path.parent / "openvino_cache"),
+                }))
+            else:
+                logger.warning("OpenVINOExecutionProvider not available, using CPUExecutionProvider")
+
+        self.session = ort.InferenceSession(str(path), sess_options=options, providers=providers)
+        self.provider = self.session.get_providers()[0]
+        self.parity: Optional[Dict[str, Any]] = None
+        logger.info(f"ONNX session ready ({self.provider}, {self.threads} threads): {path}")
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def forward_padded(self, input_ids: List[List[int]]) -> np.ndarray:
+        """Pad one bucket to its longest member and run the session"""
+        features = self.tokenizer.pad({"input_ids": input_ids}, padding="longest", return_tensors="np")
+        outputs = self.session.run(["sentence_embedding"], {
+            "input_ids": features["input_ids"].astype(np.int64),
+            "attention_mask": features["attention_mask"].astype(np.int64),
+        })
+        return outputs[0].astype(np.float32, copy=False)
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "provider": self.provider,
+            "threads": self.threads,
+            "size_mb": round(self.nbytes / (1024 * 1024), 1),
+            "parity": self.parity,
+        }
+
+
+def build_onnx_encoder(model, model_name: str, cache_dir: str, backend: str = "onnx",
+                       quantize: bool = False, threads: int = 0) -> OnnxSentenceEncoder:
+    """Export (or reuse) the ONNX artifacts for a model under cache_dir and open a session"""
+    artifacts = Path(cache_dir) / "onnx" / model_name.replace("/", "--")
+    fp32_path = artifacts / "model.onnx"
+    int8_path = artifacts / "model.int8.onnx"
+
+    if not fp32_path.exists():
+        export_onnx(model, fp32_path)
+        (artifacts / "export.json").write_text(json.dumps({
+            "model": model_name,
+            "dimension": model.get_sentence_embedding_dimension(),
+            "opset": 17,
+        }, indent=2))
+    if quantize and not int8_path.exists():
+        quantize_onnx(fp32_path, int8_path)
+
+    return OnnxSentenceEncoder(
+        int8_path if quantize else fp32_path,
+        tokenizer=model.tokenizer,
+        max_seq_length=model.max_seq_length,
+        dimension=model.get_sentence_embedding_dimension(),
+        backend=backend,
+        threads=threads,
+        quantized=quantize,
+    )
+
+
+def check_parity(reference: np.ndarray, candidate: np.ndarray, min_cosine: float) -> Dict[str, Any]:
+    """Compare torch and ONNX embeddings row by row"""
+    reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    candidate = candidate / np.maximum(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12)
+    cosine = (reference * candidate).sum(axis=1)
+    return {
+        "min_cosine": round(float(cosine.min()), 6),
+        "threshold": min_cosine,
+        "passed": bool(cosine.min() >= min_cosine),
+    }
@@ -0,0 +1,138 @@
+"""
+Scalar (int8) and binary quantization for the Embeddings Service
+Calibration ranges are computed per model and persisted under the cache dir
+"""
+
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+# Short, varied texts used to estimate the per-dimension value range of a model
+CALIBRATION_TEXTS = [
+    "What is the capital of France?",
+    "Paris is the capital and most populous city of France.",
+    "How do I reset my password?",
+    "Click 'Forgot password' on the login page and follow the emailed link.",
+    "The mitochondria is the powerhouse of the cell.",
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "def fibonacci(n): return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)",
+    "SELECT name, email FROM users WHERE created_at > NOW() - INTERVAL '7 days';",
+    "docker compose up -d --build embeddings",
+    "The quarterly revenue increased by 12% compared to the previous year.",
+    "Interest rates were raised by 25 basis points to curb inflation.",
+    "The patient presented with fever, cough and shortness of breath.",
+    "Take one tablet twice daily with food for ten days.",
+    "The defendant was found not guilty on all counts.",
+    "This agreement shall be governed by the laws of the State of Delaware.",
+    "Preheat the oven to 200 degrees and bake for 25 minutes.",
+    "Whisk the eggs with sugar until pale and fluffy.",
+    "The striker scored twice in the second half to win the match.",
+    "Rain is expected across the region tomorrow afternoon.",
+    "GPU memory utilization reached 95% during model inference.",
+    "Transformers use self-attention to model relationships between tokens.",
+    "Vector databases index embeddings for approximate nearest neighbour search.",
+    "Der schnelle braune Fuchs springt über den faulen Hund.",
+    "El aprendizaje automático es una rama de la inteligencia artificial.",
+    "La tour Eiffel a été construite pour l'Exposition universelle de 1889.",
+    "東京は日本の首都です。",
+    "Error: connection refused (ECONNREFUSED) at 127.0.0.1:6379",
+    "Meeting moved to Thursday at 3pm, please update your calendars.",
+    "I absolutely loved this product, would buy again!",
+    "Terrible customer service, I waited two hours on hold.",
+    "The Treaty of Westphalia ended the Thirty Years' War in 1648.",
+    "E = mc^2 relates mass and energy through the speed of light.",
+]
+
+
+class EmbeddingQuantizer:
+    """Quantize float embeddings to int8 or packed binary vectors.
+
+    int8 uses per-dimension ranges estimated from calibration embeddings:
+    ``q = round((x - min) / scale) - 128`` with ``scale = (max - min) / 255``,
+    so clients dequantize with ``x = (q + 128) * scale + min``. Binary keeps
+    the sign bit of each dimension and packs 8 dimensions per byte.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir) / "quantization"
+        self.model_name: Optional[str] = None
+        self.samples: Optional[np.ndarray] = None
+        self.transform_fn: Optional[Callable[[np.ndarray, int], np.ndarray]] = None
+        self._ranges: Dict[Optional[int], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _calibration_path(self, model_name: str, normalize: bool) -> Path:
+        slug = model_name.replace("/", "--")
+        return self.cache_dir / f"{slug}{'-normalized' if normalize else ''}.npy"
+
+    def calibrate(self, model_name: str, normalize: bool, encode_fn: Callable[[List[str]], np.ndarray],
+                  transform_fn: Optional[Callable[[np.ndarray, int], np.ndarray]] = None):
+        """Load persisted calibration embeddings for a model, or compute and save them.
+
+        ``transform_fn(samples, dimensions)`` maps the full calibration vectors
+        to a truncated width so ranges match what is actually quantized.
+        """
+        path = self._calibration_path(model_name, normalize)
+        self._ranges = {}
+        self.model_name = model_name
+        self.transform_fn = transform_fn
+        try:
+            if path.exists():
+                self.samples = np.load(path)
+                logger.info(f"Loaded quantization calibration from {path}")
+                return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable calibration file {path}: {e}")
+
+        self.samples = np.asarray(encode_fn(CALIBRATION_TEXTS), dtype=np.float32)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            np.save(path, self.samples, allow_pickle=False)
+            logger.info(f"Saved quantization calibration to {path}")
+        except OSError as e:
+            logger.warning(f"Could not persist calibration to {path}: {e}")
+
+    def ranges(self, dimensions: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-dimension (min, max) of the calibration embeddings"""
+        if self.samples is None:
+            raise RuntimeError("Quantizer has not been calibrated")
+        if dimensions not in self._ranges:
+            samples = self.samples
+            if dimensions:
+                samples = self.transform_fn(samples, dimensions) if self.transform_fn else samples[:, :dimensions]
+            self._ranges[dimensions] = (samples.min(axis=0), samples.max(axis=0))
+        return self._ranges[dimensions]
+
+    def quantize(self, embeddings: np.ndarray, mode: str, dimensions: Optional[int] = None) -> np.ndarray:
+        """Quantize a float32 matrix; mode is one of QUANTIZATION_MODES"""
+        if mode == "int8":
+            low, high = self.ranges(dimensions)
+            scale = np.maximum(high - low, 1e-12) / 255.0
+            quantized = np.rint((embeddings - low) / scale) - 128
+            return np.clip(quantized, -128, 127).astype(np.int8)
+        if mode == "binary":
+            return np.packbits(embeddings > 0, axis=-1)
+        return embeddings
+
+    def get_info(self, dimensions: Optional[int] = None) -> Dict[str, Any]:
+        """Metadata clients need to dequantize int8 vectors"""
+        if self.samples is None:
+            return {"calibrated": False}
+        low, high = self.ranges(dimensions)
+        return {
+            "calibrated": True,
+            "calibration_samples": int(self.samples.shape[0]),
+            "int8": {
+                "formula": "x = (q + 128) * scale + min",
+                "min": low.tolist(),
+                "scale": (np.maximum(high - low, 1e-12) / 255.0).tolist(),
+            },
+            "binary": {
+                "formula": "bit = x > 0, packed 8 dimensions per byte (big-endian bit order)",
+            },
+        }
@@ -0,0 +1,153 @@
+"""
+Response serialization for the Embeddings Service
+Number lists, OpenAI-compatible base64, and raw octet-stream / .npy bodies
+"""
+
+import base64
+import io
+import json
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+JSON_FORMATS = ("float", "base64")
+RAW_FORMATS = {
+    "binary": "application/octet-stream",
+    "npy": "application/x-npy",
+}
+ENCODING_FORMATS = JSON_FORMATS + tuple(RAW_FORMATS)
+
+
+def resolve_encoding_format(encoding_format: Optional[str], accept: Optional[str]) -> str:
+    """Pick the response format from the request body, falling back to the Accept header"""
+    encoding_format = (encoding_format or "float").lower()
+    if encoding_format not in ENCODING_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported encoding_format '{encoding_format}', expected one of {list(ENCODING_FORMATS)}"
+        )
+    if encoding_format == "float" and accept:
+        for raw_format, media_type in RAW_FORMATS.items():
+            if media_type in accept:
+                return raw_format
+    return encoding_format
+
+
+def _wire_matrix(embeddings: np.ndarray) -> np.ndarray:
+    """Contiguous little-endian matrix (float32 stays float32, quantized stays 1 byte)"""
+    if embeddings.dtype in (np.int8, np.uint8):
+        return np.ascontiguousarray(embeddings)
+    return np.ascontiguousarray(embeddings, dtype="<f4")
+
+
+def _base64_rows(embeddings: np.ndarray) -> list:
+    """Encode each row's little-endian bytes, sliced from one contiguous buffer"""
+    matrix = _wire_matrix(embeddings)
+    buffer = matrix.tobytes()
+    row_bytes = matrix.shape[1] * matrix.itemsize if matrix.ndim == 2 else 0
+    return [
+        base64.b64encode(buffer[i * row_bytes:(i + 1) * row_bytes]).decode("ascii")
+        for i in range(embeddings.shape[0])
+    ]
+
+
+def format_rows(embeddings: np.ndarray, encoding_format: str) -> List:
+    """Per-row JSON values for the float or base64 formats"""
+    if encoding_format == "base64":
+        return _base64_rows(embeddings)
+    return embeddings.tolist()
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+    """Parse a streamed NDJSON body; unparseable lines yield {"error": ...} records"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+def _parse_line(line: bytes) -> dict:
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return {"error": f"invalid JSON line: {e}"}
+    return record if isinstance(record, dict) else {"error": "each line must be a JSON object"}
+
+
+def format_embeddings(embeddings: np.ndarray, encoding_format: str, model: str, usage: Dict,
+                      quantization: str = "none", truncated: Optional[List[int]] = None,
+                      headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serialize an embedding matrix without routing numbers through pydantic.
+
+    ``truncated`` lists the indices of inputs cut at the model's max length.
+    """
+    truncated = truncated or []
+    headers = dict(headers or {})
+    if truncated:
+        headers["X-Truncated-Inputs"] = ",".join(str(i) for i in truncated)
+    if encoding_format in RAW_FORMATS:
+        matrix = _wire_matrix(embeddings)
+        headers.update({
+            "X-Embedding-Model": model,
+            "X-Embedding-Shape": ",".join(str(n) for n in matrix.shape),
+            "X-Embedding-Dtype": str(matrix.dtype),
+            "X-Embedding-Quantization": quantization,
+            "X-Usage-Prompt-Tokens": str(usage.get("prompt_tokens", 0)),
+            "X-Usage-Total-Tokens": str(usage.get("total_tokens", 0)),
+        })
+        if encoding_format == "npy":
+            buffer = io.BytesIO()
+            np.save(buffer, matrix, allow_pickle=False)
+            body = buffer.getvalue()
+        else:
+            body = matrix.tobytes()
+        return Response(content=body, media_type=RAW_FORMATS[encoding_format], headers=headers)
+
+    rows = format_rows(embeddings, encoding_format)
+    data = [
+        {"object": "embedding", "embedding": row, "index": i}
+        for i, row in enumerate(rows)
+    ]
+    for i in truncated:
+        data[i]["truncated"] = True
+    content = {
+        "object": "list",
+        "data": data,
+        "model": model,
+        "usage": {**usage, "truncated_inputs": len(truncated)} if truncated else usage,
+    }
+    if quantization != "none":
+        content["quantization"] = quantization
+    body = json.dumps(content, separators=(",", ":"))
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def format_chunked_embeddings(chunked: List, embeddings: np.ndarray, encoding_format: str, model: str,
+                              usage: Dict, quantization: str = "none") -> Response:
+    """One data item per input listing its window vectors with character offsets and token counts.
+
+    ``embeddings`` holds every window of every input in order, already post-processed.
+    """
+    rows = iter(format_rows(embeddings, encoding_format))
+    data = [
+        {
+            "object": "embedding",
+            "index": i,
+            "chunks": [
+                {"embedding": next(rows), "offset": list(offset), "tokens": count}
+                for offset, count in zip(item.offsets, item.token_counts.tolist())
+            ],
+        }
+        for i, item in enumerate(chunked)
+    ]
+    content = {"object": "list", "data": data, "model": model, "usage": usage}
+    if quantization != "none":
+        content["quantization"] = quantization
+    return Response(content=json.dumps(content, separators=(",", ":")), media_type="application/json")
@@ -0,0 +1,228 @@
+"""
+Length-bucketed batch scheduling for the Embeddings Service
+Tokenizes once, groups inputs of similar length under a token budget and restores order
+"""
+
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from metrics import observe_batch, observe_stage
+
+logger = logging.getLogger(__name__)
+
+
+class EncodedBatch:
+    """Embeddings plus per-text token accounting, sliceable like the embedding matrix"""
+
+    __slots__ = ("embeddings", "token_counts", "padded_lengths", "truncated")
+
+    def __init__(self, embeddings: np.ndarray, token_counts: np.ndarray,
+                 padded_lengths: np.ndarray, truncated: np.ndarray):
+        self.embeddings = embeddings
+        self.token_counts = token_counts
+        self.padded_lengths = padded_lengths
+        self.truncated = truncated
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def __getitem__(self, index) -> "EncodedBatch":
+        return EncodedBatch(self.embeddings[index], self.token_counts[index],
+                            self.padded_lengths[index], self.truncated[index])
+
+    @property
+    def padding_efficiency(self) -> float:
+        """Real tokens divided by the token slots they occupied after padding (cache hits excluded)"""
+        encoded = self.padded_lengths > 0
+        padded = int(self.padded_lengths[encoded].sum())
+        return float(self.token_counts[encoded].sum()) / padded if padded else 1.0
+
+
+class ChunkedEmbedding:
+    """Window vectors for one long input, with token counts and character offsets per window"""
+
+    __slots__ = ("embeddings", "token_counts", "offsets")
+
+    def __init__(self, embeddings: np.ndarray, token_counts: np.ndarray, offsets: List[Tuple[int, int]]):
+        self.embeddings = embeddings
+        self.token_counts = token_counts
+        self.offsets = offsets
+
+    def pooled(self, normalize: bool = True) -> np.ndarray:
+        """Token-weighted mean of the window vectors, so a short tail window counts for less"""
+        vector = np.average(self.embeddings, axis=0, weights=self.token_counts).astype(np.float32)
+        if normalize:
+            vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        return vector
+
+
+def plan_windows(length: int, size: int, overlap: int) -> List[Tuple[int, int]]:
+    """Token spans of overlapping windows covering ``length`` tokens (one window if it fits)"""
+    stride = max(1, size - overlap)
+    windows = []
+    start = 0
+    while True:
+        end = min(start + size, length)
+        windows.append((start, end))
+        if end >= length:
+            return windows
+        start += stride
+
+
+def plan_buckets(lengths: np.ndarray, token_budget: int, max_batch_size: int) -> List[np.ndarray]:
+    """Split indices into length-sorted buckets whose padded size fits the token budget.
+
+    Inputs are sorted by length, so each bucket is padded only to its own
+    longest member. A bucket grows until adding the next input would push
+    ``count * longest`` over ``token_budget``. Any input longer than the
+    budget gets a bucket of its own.
+    """
+    order = np.argsort(lengths, kind="stable")
+    buckets = []
+    start = 0
+    for position in range(1, len(order) + 1):
+        if position == len(order):
+            buckets.append(order[start:position])
+            break
+        count = position - start + 1
+        if count > max_batch_size or count * int(lengths[order[position]]) > token_budget:
+            buckets.append(order[start:position])
+            start = position
+    return buckets
+
+
+class LengthBucketScheduler:
+    """Run a SentenceTransformer over length-sorted, token-budgeted buckets"""
+
+    def __init__(self, token_budget: int = 16384, max_batch_size: int = 256, observe: bool = True):
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+        self.observe = observe  # off for benchmark passes, which must not skew the serving histograms
+        self.stats = {"texts": 0, "buckets": 0, "tokens": 0, "padded_tokens": 0}
+        self._prefix_ids: Dict[tuple, List[int]] = {}
+
+    def prefix_ids(self, tokenizer, prefix: str) -> List[int]:
+        """Token ids of a task prefix, tokenized once per tokenizer"""
+        key = (tokenizer.name_or_path, len(tokenizer), prefix)
+        ids = self._prefix_ids.get(key)
+        if ids is None:
+            ids = self._prefix_ids[key] = tokenizer(prefix, add_special_tokens=False)["input_ids"] if prefix else []
+        return ids
+
+    def content_limit(self, model, head: List[int]) -> int:
+        """Text tokens that fit one forward pass after the special tokens and task prefix.
+
+        ``model.max_seq_length`` is already clamped to the model's own position
+        limit when it is loaded, so truncation and windows both stay in range.
+        """
+        limit = model.max_seq_length - model.tokenizer.num_special_tokens_to_add(pair=False) - len(head)
+        return max(1, limit)
+
+    def tokenize(self, model, texts: List[str], prefix: str = ""):
+        """Tokenize once without truncation; return model-ready ids and truncation flags.
+
+        The task prefix is tokenized once and its ids are spliced in front of
+        each text's ids, instead of building a prefixed copy of every string.
+        Prefixes end at a word boundary, so for the WordPiece tokenizers these
+        models use the result matches tokenizing the concatenated string.
+        """
+        started = time.perf_counter()
+        tokenizer = model.tokenizer
+        head = self.prefix_ids(tokenizer, prefix)
+        limit = self.content_limit(model, head)
+        raw_ids = tokenizer(texts, add_special_tokens=False, truncation=False,
+                            return_attention_mask=False, return_token_type_ids=False)["input_ids"]
+        truncated = np.fromiter((len(ids) > limit for ids in raw_ids), dtype=bool, count=len(raw_ids))
+        input_ids = [tokenizer.build_inputs_with_special_tokens(head + ids[:limit]) for ids in raw_ids]
+        if self.observe:
+            observe_stage("tokenize", time.perf_counter() - started)
+        return input_ids, truncated
+
+    def forward(self, model, input_ids: List[List[int]]) -> np.ndarray:
+        """Pad one bucket to its longest member and run the model"""
+        if hasattr(model, "forward_padded"):  # ONNX Runtime backend
+            return model.forward_padded(input_ids)
+        features = model.tokenizer.pad({"input_ids": input_ids}, padding="longest", return_tensors="pt")
+        features = {name: tensor.to(model.device) for name, tensor in features.items()}
+        with torch.inference_mode():
+            output = model(features)["sentence_embedding"]
+        return output.float().cpu().numpy()
+
+    def encode(self, model, texts: List[str], normalize: bool = True, prefix: str = "",
+               input_ids: Optional[List[List[int]]] = None,
+               truncated: Optional[np.ndarray] = None) -> EncodedBatch:
+        """Encode texts bucket by bucket and return results in the original order"""
+        if input_ids is None:
+            input_ids, truncated = self.tokenize(model, texts, prefix)
+        lengths = np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(input_ids))
+        padded_lengths = np.zeros_like(lengths)
+        embeddings = None
+
+        buckets = plan_buckets(lengths, self.token_budget, self.max_batch_size)
+        for bucket in buckets:
+            started = time.perf_counter()
+            vectors = self.forward(model, [input_ids[i] for i in bucket])
+            if embeddings is None:
+                embeddings = np.empty((len(input_ids), vectors.shape[1]), dtype=np.float32)
+            embeddings[bucket] = vectors
+            padded_lengths[bucket] = lengths[bucket].max()
+            if self.observe:
+                observe_stage("forward", time.perf_counter() - started)
+                observe_batch(len(bucket), len(bucket) * int(padded_lengths[bucket[0]]))
+
+        if embeddings is None:
+            embeddings = np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+        if normalize and len(embeddings):
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+        self.stats["texts"] += len(input_ids)
+        self.stats["buckets"] += len(buckets)
+        self.stats["tokens"] += int(lengths.sum())
+        self.stats["padded_tokens"] += int(padded_lengths.sum())
+        return EncodedBatch(embeddings, lengths, padded_lengths, truncated)
+
+    def encode_windows(self, model, texts: List[str], normalize: bool = True, prefix: str = "",
+                       overlap: int = 64) -> List[ChunkedEmbedding]:
+        """Split inputs longer than the model's window into overlapping token windows and encode them.
+
+        Every text is tokenized once; the windows from all texts go through
+        the same length buckets, so a long document's chunks share forward
+        passes with other inputs instead of running one request each.
+        """
+        started = time.perf_counter()
+        tokenizer = model.tokenizer
+        head = self.prefix_ids(tokenizer, prefix)
+        size = self.content_limit(model, head)
+        encoded = tokenizer(texts, add_special_tokens=False, truncation=False, return_attention_mask=False,
+                            return_token_type_ids=False, return_offsets_mapping=True)
+        input_ids, owners, offsets = [], [], []
+        for index, (ids, char_offsets) in enumerate(zip(encoded["input_ids"], encoded["offset_mapping"])):
+            for start, end in plan_windows(len(ids), size, min(overlap, size - 1)):
+                input_ids.append(tokenizer.build_inputs_with_special_tokens(head + ids[start:end]))
+                owners.append(index)
+                offsets.append((char_offsets[start][0], char_offsets[end - 1][1]) if end > start else (0, 0))
+        if self.observe:
+            observe_stage("tokenize", time.perf_counter() - started)
+
+        batch = self.encode(model, [], normalize=normalize, input_ids=input_ids,
+                            truncated=np.zeros(len(input_ids), dtype=bool))
+        owners = np.asarray(owners, dtype=np.int64)
+        bounds = np.searchsorted(owners, np.arange(len(texts) + 1))
+        return [
+            ChunkedEmbedding(batch.embeddings[lo:hi], batch.token_counts[lo:hi], offsets[lo:hi])
+            for lo, hi in zip(bounds[:-1], bounds[1:])
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Report bucketing configuration and cumulative padding efficiency"""
+        padded = self.stats["padded_tokens"]
+        return {
+            "token_budget": self.token_budget,
+            "max_batch_size": self.max_batch_size,
+            **self.stats,
+            "padding_efficiency": round(self.stats["tokens"] / padded, 4) if padded else 1.0,
+        }
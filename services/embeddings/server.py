@@ -1,35 +1,88 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sentence_transformers import SentenceTransformer
 import torch
 import os
 import json
-from typing import List, Union, Optional, Dict
+from typing import Any, List, Union, Optional, Dict, Tuple
 import logging
 import numpy as np
 from pathlib import Path
 import asyncio
-from datetime import datetime
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from batcher import EmbeddingBatcher
+from embedding_cache import EmbeddingCache, make_cache_key
+from response_format import (JSON_FORMATS, format_chunked_embeddings, format_embeddings, format_rows, iter_ndjson,
+                             resolve_encoding_format)
+from quantization import EmbeddingQuantizer, QUANTIZATION_MODES
+from scheduler import ChunkedEmbedding, EncodedBatch, LengthBucketScheduler
+from model_pool import ModelPool, ResidentModel
+from onnx_backend import BACKENDS, PARITY_TEXTS, build_onnx_encoder, check_parity
+from jobs import JobManager, QdrantWriter
+from model_inventory import ModelInventory
+from autotune import Autotuner, synthetic_texts
+from vector_index import CollectionStore
+from metrics import (IN_FLIGHT, MODEL_LOAD_SECONDS, REQUEST_LATENCY, bind_cache, metrics_response,
+                     observe_stage, record_cache_lookups, record_chunked_usage, record_usage)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Embeddings Service")
 
+# Input types a request may declare; models map them to the task prefix they were trained with
+INPUT_TYPES = ("query", "document", "classification", "clustering")
+NOMIC_PREFIXES = {
+    "query": "search_query: ",
+    "document": "search_document: ",
+    "classification": "classification: ",
+    "clustering": "clustering: ",
+}
+BGE_PREFIXES = {"query": "Represent this sentence for searching relevant passages: "}
+
 # Global model management
 class ModelManager:
+    # Settings baked into a loaded model; changing any of them requires a reload
+    LOAD_SETTINGS = ("device", "max_length", "normalize", "cache_dir", "backend", "onnx_quantize", "onnx_threads")
+    
     def __init__(self):
         self.current_model_name = os.environ.get("MODEL_NAME", "nomic-ai/nomic-embed-text-v1.5")
         self.device = os.environ.get("DEVICE", "cpu")
         self.max_length = int(os.environ.get("MAX_LENGTH", "8192"))
         self.normalize = os.environ.get("NORMALIZE", "true").lower() == "true"
         self.cache_dir = os.environ.get("CACHE_DIR", "/home/ucadmin/.cache/huggingface")
-        self.model = None
+        self.batch_size = int(os.environ.get("BATCH_SIZE", "32"))
+        self.max_batch_size = int(os.environ.get("MAX_BATCH_SIZE", "128"))
+        self.max_batch_wait_ms = float(os.environ.get("MAX_BATCH_WAIT_MS", "5"))
+        self.max_batch_tokens = int(os.environ.get("MAX_BATCH_TOKENS", "16384"))
+        self.scheduler = LengthBucketScheduler(self.max_batch_tokens, self.batch_size)
+        self.quantization = os.environ.get("QUANTIZATION", "none").lower()
+        self.backend = os.environ.get("BACKEND", "torch").lower()
+        self.onnx_quantize = os.environ.get("ONNX_QUANTIZE", "false").lower() == "true"
+        self.onnx_threads = int(os.environ.get("ONNX_THREADS", "0"))
+        self.pool = ModelPool(
+            max_models=int(os.environ.get("MODEL_POOL_SIZE", "2")),
+            max_bytes=int(os.environ.get("MODEL_POOL_MEMORY_MB", "0")) * 1024 * 1024
+        )
+        self.loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-load")
+        self.switch_status: Dict[str, Any] = {"state": "idle"}
+        self.switch_task: Optional[asyncio.Task] = None
+        self.autotune_on_start = os.environ.get("AUTOTUNE", "false").lower() == "true"
+        self.torch_threads = torch.get_num_threads()  # what the encode worker runs with; tuning updates it
+        self.autotuner = Autotuner(self.cache_dir, max_seconds=float(os.environ.get("AUTOTUNE_MAX_SECONDS", "120")))
         self.available_models = {
-            "nomic-ai/nomic-embed-text-v1.5": {"dimensions": 768, "max_length": 8192},
-            "BAAI/bge-base-en-v1.5": {"dimensions": 768, "max_length": 512},
-            "BAAI/bge-large-en-v1.5": {"dimensions": 1024, "max_length": 512},
-            "BAAI/bge-small-en-v1.5": {"dimensions": 384, "max_length": 512},
+            "nomic-ai/nomic-embed-text-v1.5": {
+                "dimensions": 768, "max_length": 8192,
+                "matryoshka_dims": [768, 512, 256, 128, 64], "matryoshka_layer_norm": True,
+                "prefixes": NOMIC_PREFIXES
+            },
+            "BAAI/bge-base-en-v1.5": {"dimensions": 768, "max_length": 512, "prefixes": BGE_PREFIXES},
+            "BAAI/bge-large-en-v1.5": {"dimensions": 1024, "max_length": 512, "prefixes": BGE_PREFIXES},
+            "BAAI/bge-small-en-v1.5": {"dimensions": 384, "max_length": 512, "prefixes": BGE_PREFIXES},
             "sentence-transformers/all-MiniLM-L6-v2": {"dimensions": 384, "max_length": 256},
             "sentence-transformers/all-mpnet-base-v2": {"dimensions": 768, "max_length": 384},
             "thenlper/gte-large": {"dimensions": 1024, "max_length": 512},
@@ -38,72 +91,586 @@ class ModelManager:
         }
         self.load_model()
         
-    def load_model(self, model_name: Optional[str] = None):
-        """Load or switch to a different model"""
-        if model_name:
-            self.current_model_name = model_name
-            
-        logger.info(f"Loading embedding model: {self.current_model_name}")
-        logger.info(f"Device: {self.device}, Max length: {self.max_length}, Normalize: {self.normalize}")
+    @property
+    def active(self) -> ResidentModel:
+        """The model that serves requests without an explicit (known) model field"""
+        return self.pool.peek(self.current_model_name)
+        
+    @property
+    def model(self):
+        entry = self.active
+        return entry.model if entry else None
+        
+    @property
+    def quantizer(self) -> EmbeddingQuantizer:
+        entry = self.active
+        return entry.quantizer if entry else EmbeddingQuantizer(self.cache_dir)
+        
+    def current_settings(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.LOAD_SETTINGS}
+        
+    def _load_resident(self, model_name: str, settings: Optional[Dict[str, Any]] = None) -> ResidentModel:
+        """Load a model from disk into a new pool entry (does not touch the active pointer).
+        
+        ``settings`` overrides the current load settings, so a replacement can be
+        built while the old model keeps serving with the old ones.
+        """
+        settings = {**self.current_settings(), **(settings or {})}
+        logger.info(f"Loading embedding model: {model_name}")
+        logger.info(f"Device: {settings['device']}, Max length: {settings['max_length']}, "
+                    f"Normalize: {settings['normalize']}")
+        started = time.perf_counter()
         
         try:
             # Configure model with trust_remote_code for nomic models
-            self.model = SentenceTransformer(
-                self.current_model_name,
-                device=self.device,
-                cache_folder=self.cache_dir,
+            model = SentenceTransformer(
+                model_name,
+                device=settings["device"],
+                cache_folder=settings["cache_dir"],
                 trust_remote_code=True  # Required for nomic models
             )
-            self.model.max_seq_length = self.max_length
+            # MAX_LENGTH is a ceiling; each model is also capped at its own position table
+            model.max_seq_length = min(settings["max_length"], self.model_max_length(model_name, model))
             
             logger.info("Model loaded successfully")
-            logger.info(f"Model dimension: {self.model.get_sentence_embedding_dimension()}")
+            logger.info(f"Model dimension: {model.get_sentence_embedding_dimension()}")
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             raise
+        
+        if settings["backend"] != "torch":
+            if settings["device"] != "cpu":
+                # Export moves the modules to CPU, which would leave the torch fallback off the GPU
+                logger.warning(f"The {settings['backend']} backend runs on CPU only; "
+                               f"serving {model_name} with torch on {settings['device']}")
+            else:
+                model = self._load_onnx(model_name, model, settings)
+        
+        # Calibrate int8 ranges for this model (persisted, so only computed once)
+        quantizer = EmbeddingQuantizer(settings["cache_dir"])
+        normalize = settings["normalize"]
+        try:
+            quantizer.calibrate(model_name, normalize,
+                                lambda texts: self.scheduler.encode(model, texts, normalize=normalize).embeddings,
+                                transform_fn=lambda samples, dims: self.truncate_dimensions(samples, dims, model_name))
+        except Exception as e:
+            logger.warning(f"Quantization calibration failed: {e}")
+        
+        load_seconds = time.perf_counter() - started
+        MODEL_LOAD_SECONDS.labels(model_name).set(load_seconds)
+        return ResidentModel(model_name, model, quantizer, load_seconds=load_seconds)
+        
+    def model_max_length(self, model_name: str, model) -> int:
+        """Longest input a model supports: its available_models entry, else its tokenizer's limit"""
+        known = self.available_models.get(model_name, {}).get("max_length")
+        if known:
+            return known
+        limit = getattr(model.tokenizer, "model_max_length", None)
+        # Tokenizers without a configured limit report a huge sentinel value
+        if limit and limit < 1_000_000:
+            return int(limit)
+        return model.max_seq_length or self.max_length
+        
+    def _load_onnx(self, model_name: str, torch_model, settings: Dict[str, Any]):
+        """Swap a loaded torch model for its ONNX Runtime export, keeping torch if parity fails"""
+        quantize = settings["onnx_quantize"]
+        try:
+            encoder = build_onnx_encoder(
+                torch_model, model_name, settings["cache_dir"],
+                backend=settings["backend"], quantize=quantize, threads=settings["onnx_threads"]
+            )
+            reference = self.scheduler.encode(torch_model, PARITY_TEXTS, normalize=True).embeddings
+            candidate = self.scheduler.encode(encoder, PARITY_TEXTS, normalize=True).embeddings
+            encoder.parity = check_parity(reference, candidate, 0.99 if quantize else 0.9999)
+        except Exception as e:
+            logger.error(f"ONNX backend unavailable for {model_name}, serving with torch: {e}")
+            return torch_model
+        
+        if not encoder.parity["passed"]:
+            logger.error(f"ONNX parity check failed for {model_name} "
+                         f"(min cosine {encoder.parity['min_cosine']}), serving with torch")
+            return torch_model
+        logger.info(f"ONNX parity check passed for {model_name} (min cosine {encoder.parity['min_cosine']})")
+        return encoder
+        
+    def warm_model(self, model_name: str) -> ResidentModel:
+        """Make a model resident without switching to it (runs on the loader thread)"""
+        entry = self.pool.get(model_name)
+        if entry is not None:
+            return entry
+        self.pool.loading[model_name] = "loading"
+        try:
+            entry = self._load_resident(model_name)
+            self.pool.add(entry, pinned=[self.current_model_name])
+            self.pool.loading.pop(model_name, None)
+            return entry
+        except Exception as e:
+            self.pool.loading[model_name] = f"failed: {e}"
+            raise
+        
+    def load_model(self, model_name: Optional[str] = None, reload: bool = False):
+        """Load or switch to a different model.
+
+        Switching to a resident model is an atomic pointer swap. Calling
+        without a name (or with reload) loads the model fresh with the current
+        settings and drops every resident model loaded with the old ones.
+        """
+        if model_name is None:
+            model_name = self.current_model_name
+            reload = True
+        
+        if reload:
+            entry = self._load_resident(model_name)
+            self.pool.clear()
+            self.pool.add(entry)
+        else:
+            self.warm_model(model_name)
+        self.current_model_name = model_name
+        
+    def prepare_switch(self, model_name: str, settings: Dict[str, Any]) -> ResidentModel:
+        """Load the switch target on the loader thread; the active model keeps serving meanwhile"""
+        if settings:
+            return self._load_resident(model_name, settings)
+        return self.warm_model(model_name)
+        
+    def start_switch(self, model_name: str, settings: Dict[str, Any]) -> asyncio.Task:
+        """Begin a background switch; progress is reported in switch_status.
+        
+        ``settings`` holds only the load settings that differ from the current
+        ones; if any are given the pool is rebuilt around the new model.
+        """
+        self.switch_status = {
+            "state": "loading",
+            "model": model_name,
+            "previous_model": self.current_model_name,
+            "settings": settings,
+            "started_at": time.time(),
+        }
+        self.switch_task = asyncio.create_task(self._switch(model_name, settings, self.switch_status))
+        return self.switch_task
+        
+    async def _switch(self, model_name: str, settings: Dict[str, Any], status: Dict[str, Any]):
+        """Load in the background, drain in-flight batches, then swap model and settings atomically"""
+        loop = asyncio.get_running_loop()
+        try:
+            entry = await loop.run_in_executor(self.loader, self.prepare_switch, model_name, settings)
+            status["load_seconds"] = round(entry.load_seconds, 2)
+            
+            # Requests already queued finish on the model they were routed to
+            status["state"] = "draining"
+            drain_started = time.perf_counter()
+            await batcher.drain()
+            status["drain_seconds"] = round(time.perf_counter() - drain_started, 3)
+            
+            # No await between these lines, so no request ever sees a half-applied switch
+            for name, value in settings.items():
+                setattr(self, name, value)
+            if settings:
+                self.pool.clear()
+                self.pool.add(entry)
+            self.current_model_name = model_name
             
-    def get_model_info(self):
+            await embedding_cache.clear()
+            model_inventory.set_cache_dir(self.cache_dir)
+            model_inventory.request_refresh()  # the load may have downloaded a model
+            self.apply_stored_tuning()
+            status["state"] = "ready"
+            logger.info(f"Switched to model: {model_name}")
+        except Exception as e:
+            logger.error(f"Failed to switch to {model_name}, still serving {self.current_model_name}: {e}")
+            status["state"] = "failed"
+            status["error"] = str(e)
+        status["finished_at"] = time.time()
+        
+    @property
+    def switching(self) -> bool:
+        return self.switch_task is not None and not self.switch_task.done()
+        
+    async def acquire(self, requested: Optional[str] = None) -> ResidentModel:
+        """Route a request to a resident model, warm-loading known models on demand"""
+        if requested and requested != self.current_model_name:
+            entry = self.pool.get(requested)
+            if entry is not None:
+                return entry
+            if requested in self.available_models:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.loader, self.warm_model, requested)
+        # Unknown names (e.g. OpenAI model aliases) are served by the active model
+        return self.active
+
+    def supports_dimensions(self, model_name: Optional[str] = None) -> bool:
+        """Whether a model was trained with Matryoshka representation learning"""
+        info = self.available_models.get(model_name or self.current_model_name, {})
+        return bool(info.get("matryoshka_dims"))
+        
+    def truncate_dimensions(self, embeddings: np.ndarray, dimensions: int,
+                            model_name: Optional[str] = None) -> np.ndarray:
+        """Matryoshka truncation: keep the leading dimensions and renormalize the whole batch"""
+        info = self.available_models.get(model_name or self.current_model_name, {})
+        if info.get("matryoshka_layer_norm"):
+            # nomic applies layer norm over the full vector before truncating
+            mean = embeddings.mean(axis=1, keepdims=True)
+            std = embeddings.std(axis=1, keepdims=True)
+            embeddings = (embeddings - mean) / np.maximum(std, 1e-12)
+        truncated = np.array(embeddings[:, :dimensions], dtype=np.float32)
+        if self.normalize:
+            norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+            truncated /= np.maximum(norms, 1e-12)
+        return truncated
+        
+    def encode(self, texts: List[str], key: tuple):
+        """Run the forward pass for a coalesced batch of one (model, task prefix) (called on the encode thread).
+        
+        A key of (model, prefix, overlap) selects chunk-and-pool mode and
+        returns one ChunkedEmbedding per text instead of an EncodedBatch.
+        """
+        entry, prefix, *window = key
+        if window:
+            return self.scheduler.encode_windows(entry.model, texts, normalize=self.normalize,
+                                                 prefix=prefix, overlap=window[0])
+        return self.scheduler.encode(entry.model, texts, normalize=self.normalize, prefix=prefix)
+            
+    def backend_info(self):
+        """Configured backend and what the active model is actually served with"""
+        model = self.model
+        info = {"configured": self.backend, "active": "onnx" if hasattr(model, "forward_padded") else "torch"}
+        if hasattr(model, "get_info"):
+            info.update(model.get_info(), quantized=self.onnx_quantize)
+        return info
+        
+    def tuning_key(self, entry: ResidentModel) -> str:
+        """Tuning results depend on the runtime, so torch and ONNX are tuned separately"""
+        return f"{entry.name} ({'onnx' if hasattr(entry.model, 'forward_padded') else 'torch'})"
+        
+    def apply_tuning(self, result: Dict[str, Any]):
+        """Apply a tuned thread count and per-pass token budget if they were measured for the active model"""
+        entry = self.active
+        if entry is None or result.get("model") != self.tuning_key(entry):
+            return
+        if not hasattr(entry.model, "forward_padded"):  # ONNX sessions keep their own thread pool
+            # The thread count is per thread, so set it on the encode worker that serves requests
+            batcher.executor.submit(torch.set_num_threads, result["threads"])
+            self.torch_threads = result["threads"]
+        self.max_batch_tokens = result["batch"]
+        self.scheduler.token_budget = result["batch"]
+        logger.info(f"Applied tuning: {result['threads']} threads, {result['batch']} tokens per forward pass")
+        
+    def apply_stored_tuning(self) -> bool:
+        entry = self.active
+        result = self.autotuner.lookup(self.tuning_key(entry)) if entry else None
+        if result:
+            self.apply_tuning(result)
+        return result is not None
+        
+    def start_autotune(self) -> asyncio.Task:
+        """Benchmark the active model over thread counts and token budgets on synthetic inputs"""
+        entry = self.active
+        texts = synthetic_texts(64, [8, 32, 128, 384])  # short queries through long passages
+        
+        def run(token_budget: int) -> int:
+            LengthBucketScheduler(token_budget, self.batch_size, observe=False).encode(entry.model, texts, normalize=self.normalize)
+            return len(texts)
+        
+        onnx = hasattr(entry.model, "forward_padded")
+        return self.autotuner.start(
+            self.tuning_key(entry), run, [2048, 4096, 8192, 16384, 32768], batcher.executor,
+            on_result=self.apply_tuning, threads=[torch.get_num_threads()] if onnx else None
+        )
+        
+    def get_model_info(self, dimensions: Optional[int] = None):
         """Get information about the current model"""
         return {
             "name": self.current_model_name,
             "dimensions": self.model.get_sentence_embedding_dimension() if self.model else 0,
             "max_length": self.max_length,
             "device": self.device,
-            "normalize": self.normalize
+            "normalize": self.normalize,
+            "backend": self.backend_info(),
+            "matryoshka_dims": self.available_models.get(self.current_model_name, {}).get("matryoshka_dims"),
+            "pool": self.pool.get_stats(),
+            "batching": batcher.get_stats(),
+            "scheduler": self.scheduler.get_stats(),
+            "threads": self.torch_threads,
+            "autotune": self.autotuner.get_info(self.tuning_key(self.active)) if self.active else None,
+            "cache": embedding_cache.get_stats(),
+            "quantization": {"default": self.quantization, **self.quantizer.get_info(dimensions)}
         }
 
 # Initialize model manager
 model_manager = ModelManager()
 
+# Requests from concurrent callers are coalesced into shared forward passes
+batcher = EmbeddingBatcher(
+    model_manager.encode,
+    max_batch_size=model_manager.max_batch_size,
+    max_wait_ms=model_manager.max_batch_wait_ms
+)
+
+# Bulk NDJSON streaming keeps at most this many batches in flight per request
+STREAM_PIPELINE_DEPTH = int(os.environ.get("STREAM_PIPELINE_DEPTH", "4"))
+
+# Content-addressed cache so repeated texts skip the forward pass
+embedding_cache = EmbeddingCache(
+    max_bytes=int(os.environ.get("EMBEDDING_CACHE_MB", "256")) * 1024 * 1024,
+    ttl=int(os.environ.get("EMBEDDING_CACHE_TTL", "0")),
+    backend=os.environ.get("EMBEDDING_CACHE_BACKEND", "memory"),
+    redis_url=os.environ.get("REDIS_URL"),
+    disk_path=Path(model_manager.cache_dir) / "embedding_cache.sqlite3"
+)
+bind_cache(embedding_cache)
+
+async def embed_for_job(model: Optional[str], texts: List[str]) -> np.ndarray:
+    """Bulk jobs go through the same routing, cache and batching as HTTP requests"""
+    entry = await model_manager.acquire(model)
+    result = await embed_texts(entry, texts, task_prefix(entry))
+    return result.embeddings
+
+# Bulk ingest jobs that upsert straight into unicorn-qdrant
+job_manager = JobManager(
+    Path(model_manager.cache_dir) / "jobs",
+    embed_for_job,
+    QdrantWriter(os.environ.get("QDRANT_URL", "http://unicorn-qdrant:6333"), os.environ.get("QDRANT_API_KEY") or None),
+    max_concurrent=int(os.environ.get("MAX_CONCURRENT_JOBS", "1")),
+    import_root=Path(os.environ.get("JOB_IMPORT_DIR", "/data"))
+)
+
+# Index of the HF cache for /model/cached and /model/available
+model_inventory = ModelInventory(
+    model_manager.cache_dir,
+    refresh_interval=float(os.environ.get("MODEL_INVENTORY_REFRESH_SECONDS", "30"))
+)
+
+# Small named vector collections searched in-process (persistent ones are memory-mapped)
+vector_store = CollectionStore(Path(model_manager.cache_dir) / "collections")
+
+@app.on_event("startup")
+async def start_batcher():
+    await batcher.start()
+    await model_inventory.start()
+    vector_store.load_all()
+    job_manager.resume_all()
+    if not model_manager.apply_stored_tuning() and model_manager.autotune_on_start:
+        model_manager.start_autotune()
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await job_manager.shutdown()
+    await model_inventory.stop()
+    await batcher.stop()
+
 class EmbeddingRequest(BaseModel):
     input: Union[str, List[str]]
     model: Optional[str] = None
-    encoding_format: Optional[str] = "float"
+    encoding_format: Optional[str] = "float"  # float, base64, binary (raw buffer) or npy
+    quantization: Optional[str] = None  # none, int8 or binary (defaults to the service setting)
+    dimensions: Optional[int] = None  # Matryoshka truncation (OpenAI compatible)
+    input_type: Optional[str] = None  # query, document (default), classification or clustering
+    long_text: Optional[str] = "truncate"  # truncate, mean (pool overlapping windows) or chunks (one vector per window)
+    chunk_overlap: Optional[int] = 64  # tokens shared by consecutive windows
+    
+class JobRequest(BaseModel):
+    path: str
+    collection: str
+    model: Optional[str] = None
+    batch_size: Optional[int] = 256
+    chunk_size: Optional[int] = 256  # words per chunk
+    chunk_overlap: Optional[int] = 32
+    
+class CollectionAddRequest(BaseModel):
+    texts: Optional[List[str]] = None  # embedded with the collection's model
+    vectors: Optional[List[List[float]]] = None  # or precomputed vectors
+    ids: Optional[List[str]] = None  # existing ids are overwritten; generated when omitted
+    payloads: Optional[List[dict]] = None
+    model: Optional[str] = None
+    dtype: Optional[str] = "float32"  # float32 or int8, fixed when the collection is created
+    persist: Optional[bool] = False  # memory-mapped under CACHE_DIR/collections
+    
+class CollectionSearchRequest(BaseModel):
+    queries: Optional[Union[str, List[str]]] = None
+    vectors: Optional[List[List[float]]] = None
+    top_k: Optional[int] = 10
+    include_payloads: Optional[bool] = True
     
 class ModelSwitchRequest(BaseModel):
     model_name: str
     device: Optional[str] = None
     max_length: Optional[int] = None
     normalize: Optional[bool] = None
+    wait: Optional[bool] = False  # respond only once the new model is serving
+    
+class ModelWarmRequest(BaseModel):
+    model_name: str
     
 class ModelSettings(BaseModel):
     device: Optional[str] = None
     max_length: Optional[int] = None
     normalize: Optional[bool] = None
-    batch_size: Optional[int] = None
+    batch_size: Optional[int] = None  # texts per forward pass (per length bucket)
+    max_batch_tokens: Optional[int] = None  # padded tokens per forward pass
     cache_dir: Optional[str] = None
+    quantization: Optional[str] = None
+    backend: Optional[str] = None  # torch, onnx or openvino
+    onnx_quantize: Optional[bool] = None
+    onnx_threads: Optional[int] = None
+
+def resolve_output_options(entry: ResidentModel, dimensions: Optional[int],
+                           quantization: Optional[str]) -> Tuple[Optional[int], str]:
+    """Validate per-request dimensions and quantization against the routed model"""
+    quantization = (quantization or model_manager.quantization).lower()
+    if quantization not in QUANTIZATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported quantization '{quantization}'")
+    
+    full_dimensions = entry.dimension
+    dimensions = dimensions if dimensions != full_dimensions else None
+    if dimensions is not None:
+        if not model_manager.supports_dimensions(entry.name):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Model {entry.name} does not support the dimensions parameter"
+            )
+        if not 1 <= dimensions <= full_dimensions:
+            raise HTTPException(status_code=400, detail=f"dimensions must be between 1 and {full_dimensions}")
+    return dimensions, quantization
+
+def task_prefix(entry: ResidentModel, input_type: Optional[str] = None) -> str:
+    """Task prefix the routed model expects for this input type (documents by default)"""
+    input_type = (input_type or "document").lower()
+    if input_type not in INPUT_TYPES:
+        raise HTTPException(status_code=400, detail=f"input_type must be one of {list(INPUT_TYPES)}")
+    prefixes = model_manager.available_models.get(entry.name, {}).get("prefixes", {})
+    return prefixes.get(input_type, "")
+
+async def embed_texts(entry: ResidentModel, texts: List[str], prefix: str) -> EncodedBatch:
+    """Embed texts through the cache and the batcher, returning full vectors and token accounting in order"""
+    # Serve repeated texts from the cache, encode only the misses
+    keys = [
+        make_cache_key(entry.name, entry.runtime, model_manager.normalize, entry.max_length, prefix, text)
+        for text in texts
+    ]
+    cached = await embedding_cache.get_many(keys)
+    misses = sum(1 for hit in cached if hit is None)
+    record_cache_lookups(len(cached) - misses, misses)
+    
+    embeddings = np.empty((len(texts), entry.dimension), dtype=np.float32)
+    token_counts = np.zeros(len(texts), dtype=np.int64)
+    padded_lengths = np.zeros(len(texts), dtype=np.int64)  # stays 0 for cache hits
+    truncated = np.zeros(len(texts), dtype=bool)
+    
+    # Deduplicate misses so each unique text is encoded once
+    miss_positions: Dict[str, List[int]] = {}
+    for i, hit in enumerate(cached):
+        if hit is None:
+            miss_positions.setdefault(keys[i], []).append(i)
+        else:
+            embeddings[i] = hit.vector
+            token_counts[i] = hit.token_count
+            truncated[i] = hit.truncated
+    
+    if miss_positions:
+        miss_keys = list(miss_positions)
+        miss_texts = [texts[miss_positions[key][0]] for key in miss_keys]
+        
+        # Generate embeddings (batched with other in-flight requests for the same model and prefix;
+        # the prefix is spliced in at the token level)
+        encoded = await batcher.submit(miss_texts, key=(entry, prefix))
+        await embedding_cache.put_many(miss_keys, encoded.embeddings, encoded.token_counts, encoded.truncated)
+        
+        # Merge the fresh vectors back into request order
+        for j, key in enumerate(miss_keys):
+            positions = miss_positions[key]
+            embeddings[positions] = encoded.embeddings[j]
+            token_counts[positions] = encoded.token_counts[j]
+            padded_lengths[positions[0]] = encoded.padded_lengths[j]
+            truncated[positions] = encoded.truncated[j]
+    
+    result = EncodedBatch(embeddings, token_counts, padded_lengths, truncated)
+    record_usage(entry.name, result)
+    return result
+
+LONG_TEXT_MODES = ("truncate", "mean", "chunks")
+
+async def embed_windows(entry: ResidentModel, texts: List[str], prefix: str, overlap: int) -> List[ChunkedEmbedding]:
+    """Chunk-and-pool path; it bypasses the cache, which holds one full-text vector per key"""
+    chunked = await batcher.submit(texts, key=(entry, prefix, overlap))
+    record_chunked_usage(entry.name, len(texts), sum(int(item.token_counts.sum()) for item in chunked))
+    return chunked
+
+async def create_long_text_embeddings(request: EmbeddingRequest, entry: ResidentModel, texts: List[str],
+                                      encoding_format: str, dimensions: Optional[int], quantization: str):
+    """Embed inputs of any length by windowing them and returning pooled or per-window vectors"""
+    mode = request.long_text.lower()
+    if mode == "chunks" and encoding_format not in JSON_FORMATS:
+        raise HTTPException(status_code=400, detail=f"long_text=chunks supports encoding_format {list(JSON_FORMATS)}")
+    overlap = request.chunk_overlap if request.chunk_overlap is not None else 64
+    if overlap < 0:
+        raise HTTPException(status_code=400, detail="chunk_overlap must not be negative")
+    
+    chunked = await embed_windows(entry, texts, task_prefix(entry, request.input_type), overlap)
+    total_tokens = sum(int(item.token_counts.sum()) for item in chunked)
+    usage = {
+        "prompt_tokens": total_tokens,
+        "total_tokens": total_tokens,
+        "chunks": sum(len(item.offsets) for item in chunked)
+    }
     
-class EmbeddingResponse(BaseModel):
-    object: str = "list"
-    data: List[dict]
-    model: str
-    usage: dict
+    started = time.perf_counter()
+    if mode == "mean":
+        pooled = np.zeros((0, entry.dimension), dtype=np.float32)
+        if chunked:
+            pooled = np.stack([item.pooled(model_manager.normalize) for item in chunked])
+        response = format_embeddings(postprocess(entry, pooled, dimensions, quantization), encoding_format,
+                                     model=request.model or entry.name, usage=usage, quantization=quantization)
+    else:
+        windows = np.concatenate([item.embeddings for item in chunked] or [np.zeros((0, entry.dimension), dtype=np.float32)])
+        response = format_chunked_embeddings(chunked, postprocess(entry, windows, dimensions, quantization),
+                                             encoding_format, model=request.model or entry.name,
+                                             usage=usage, quantization=quantization)
+    observe_stage("serialize", time.perf_counter() - started)
+    logger.info(f"Embedded {len(texts)} long text(s) as {usage['chunks']} window(s) ({mode})")
+    return response
+
+def postprocess(entry: ResidentModel, embeddings: np.ndarray, dimensions: Optional[int],
+                quantization: str) -> np.ndarray:
+    """Truncate and quantize after caching so the cache always holds full vectors"""
+    started = time.perf_counter()
+    if dimensions is not None and len(embeddings):
+        embeddings = model_manager.truncate_dimensions(embeddings, dimensions, entry.name)
+    if quantization != "none":
+        embeddings = entry.quantizer.quantize(embeddings, quantization, dimensions)
+    observe_stage("postprocess", time.perf_counter() - started)
+    return embeddings
+
+# Endpoints whose latency and concurrency are exported on /metrics
+INSTRUMENTED_PATHS = {"/embeddings", "/v1/embeddings", "/v1/embeddings/stream"}
+
+@app.middleware("http")
+async def track_requests(http_request: Request, call_next):
+    """Count in-flight embedding requests and time them (streams until their first byte)"""
+    path = http_request.url.path
+    if path not in INSTRUMENTED_PATHS:
+        return await call_next(http_request)
+    IN_FLIGHT.inc()
+    started = time.perf_counter()
+    try:
+        return await call_next(http_request)
+    finally:
+        IN_FLIGHT.dec()
+        REQUEST_LATENCY.labels(path).observe(time.perf_counter() - started)
 
 @app.post("/embeddings")
 @app.post("/v1/embeddings")  # OpenAI compatible endpoint
-async def create_embeddings(request: EmbeddingRequest):
+async def create_embeddings(request: EmbeddingRequest, http_request: Request):
     """Create embeddings for the given input text(s)"""
     try:
+        encoding_format = resolve_encoding_format(request.encoding_format, http_request.headers.get("accept"))
+        long_text = (request.long_text or "truncate").lower()
+        if long_text not in LONG_TEXT_MODES:
+            raise HTTPException(status_code=400, detail=f"long_text must be one of {list(LONG_TEXT_MODES)}")
+        
+        # Route by the request's model field (resident models are shared, not reloaded)
+        entry = await model_manager.acquire(request.model)
+        dimensions, quantization = resolve_output_options(entry, request.dimensions, request.quantization)
+        
         # Handle single string or list of strings
         if isinstance(request.input, str):
             texts = [request.input]
@@ -112,52 +679,292 @@ async def create_embeddings(request: EmbeddingRequest):
             
         logger.info(f"Creating embeddings for {len(texts)} text(s)")
         
-        # Add task prefix for nomic models (improves performance)
-        if "nomic" in model_manager.current_model_name.lower():
-            texts = [f"search_document: {text}" for text in texts]
+        if long_text != "truncate":
+            return await create_long_text_embeddings(request, entry, texts, encoding_format, dimensions, quantization)
         
-        # Generate embeddings
-        embeddings = model_manager.model.encode(
-            texts,
-            convert_to_tensor=False,
-            normalize_embeddings=model_manager.normalize,
-            show_progress_bar=False
-        )
+        result = await embed_texts(entry, texts, task_prefix(entry, request.input_type))
+        embeddings = postprocess(entry, result.embeddings, dimensions, quantization)
+        padding_efficiency = result.padding_efficiency
         
-        # Convert to list format
-        if isinstance(embeddings, np.ndarray):
-            embeddings_list = embeddings.tolist()
-        else:
-            embeddings_list = embeddings
-        
-        # Format response in OpenAI format
-        data = []
-        for i, embedding in enumerate(embeddings_list):
-            data.append({
-                "object": "embedding",
-                "embedding": embedding,
-                "index": i
-            })
-        
-        # Calculate token usage (approximate)
-        total_tokens = sum(len(text.split()) * 1.3 for text in texts)  # Rough estimate
-        
-        response = EmbeddingResponse(
-            data=data,
-            model=request.model or model_manager.current_model_name,
+        # Exact usage from the tokenization the model already did (cached with each vector)
+        total_tokens = int(result.token_counts.sum())
+        truncated = np.flatnonzero(result.truncated).tolist()
+        if truncated:
+            logger.warning(f"{len(truncated)} input(s) truncated at {entry.max_length} tokens")
+        
+        # Format response in OpenAI format (or as a raw buffer)
+        started = time.perf_counter()
+        response = format_embeddings(
+            embeddings,
+            encoding_format,
+            model=request.model or entry.name,
             usage={
-                "prompt_tokens": int(total_tokens),
-                "total_tokens": int(total_tokens)
-            }
+                "prompt_tokens": total_tokens,
+                "total_tokens": total_tokens
+            },
+            quantization=quantization,
+            truncated=truncated,
+            headers={"X-Padding-Efficiency": f"{padding_efficiency:.4f}"}
         )
+        observe_stage("serialize", time.perf_counter() - started)
         
-        logger.info(f"Successfully created {len(data)} embeddings")
+        logger.info(f"Successfully created {len(embeddings)} embeddings "
+                    f"(padding efficiency {padding_efficiency:.2%})")
         return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating embeddings: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/v1/embeddings/stream")
+async def stream_embeddings(http_request: Request, model: Optional[str] = None,
+                            batch_size: int = 256, encoding_format: str = "float",
+                            dimensions: Optional[int] = None, quantization: Optional[str] = None,
+                            input_type: Optional[str] = None):
+    """Embed an NDJSON body of {"id", "text"} lines and stream NDJSON results back.
+
+    Lines are grouped into batches of ``batch_size``; up to STREAM_PIPELINE_DEPTH
+    batches are in flight at once, so the model stays busy while earlier
+    results are written out. When the pipeline is full the body is no longer
+    read, which pushes back on the client through TCP flow control.
+    """
+    if encoding_format not in JSON_FORMATS:
+        raise HTTPException(status_code=400, detail=f"encoding_format must be one of {list(JSON_FORMATS)}")
+    if not 1 <= batch_size <= 4096:
+        raise HTTPException(status_code=400, detail="batch_size must be between 1 and 4096")
+    entry = await model_manager.acquire(model)
+    dimensions, quantization = resolve_output_options(entry, dimensions, quantization)
+    prefix = task_prefix(entry, input_type)
+    pipeline: asyncio.Queue = asyncio.Queue(maxsize=STREAM_PIPELINE_DEPTH)
+    
+    async def embed_batch(records: List[dict]) -> List[str]:
+        valid = [r for r in records if isinstance(r.get("text"), str)]
+        result = await embed_texts(entry, [r["text"] for r in valid], prefix)
+        embeddings = postprocess(entry, result.embeddings, dimensions, quantization)
+        started = time.perf_counter()
+        rows = iter(format_rows(embeddings, encoding_format))
+        counts = iter(result.token_counts.tolist())
+        flags = iter(result.truncated.tolist())
+        lines = []
+        for record in records:
+            if isinstance(record.get("text"), str):
+                line = {"id": record.get("id"), "embedding": next(rows), "tokens": next(counts)}
+                if next(flags):
+                    line["truncated"] = True
+                lines.append(json.dumps(line, separators=(",", ":")))
+            else:
+                lines.append(json.dumps({"id": record.get("id"), "error": record.get("error", "missing 'text'")}))
+        observe_stage("serialize", time.perf_counter() - started)
+        return lines
+    
+    async def read_body():
+        """Parse request lines into batches and start embedding each one as soon as it is full"""
+        try:
+            batch = []
+            async for record in iter_ndjson(http_request.stream()):
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    await pipeline.put(asyncio.create_task(embed_batch(batch)))
+                    batch = []
+            if batch:
+                await pipeline.put(asyncio.create_task(embed_batch(batch)))
+        except Exception as e:
+            await pipeline.put(e)
+        await pipeline.put(None)
+    
+    async def write_results():
+        reader = asyncio.create_task(read_body())
+        count = 0
+        try:
+            while True:
+                item = await pipeline.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    yield json.dumps({"error": str(item)}) + "\n"
+                    break
+                lines = await item
+                count += len(lines)
+                yield "\n".join(lines) + "\n"
+            logger.info(f"Streamed {count} embeddings")
+        finally:
+            reader.cancel()
+            # Drop work for batches the client will never read
+            while not pipeline.empty():
+                item = pipeline.get_nowait()
+                if isinstance(item, asyncio.Task):
+                    item.cancel()
+    
+    return StreamingResponse(write_results(), media_type="application/x-ndjson")
+
+@app.post("/jobs")
+async def create_job(http_request: Request):
+    """Start a bulk embedding job from a server-side file path (JSON) or a JSONL upload (multipart)"""
+    try:
+        if http_request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await http_request.form()
+            upload = form.get("file")
+            if upload is None or not form.get("collection"):
+                raise HTTPException(status_code=400, detail="multipart jobs need 'file' and 'collection' fields")
+            
+            job_id = job_manager.new_job_id()
+            path = await job_manager.save_upload(job_id, upload)
+            options = {k: form[k] for k in ("model", "batch_size", "chunk_size", "chunk_overlap") if form.get(k)}
+            try:
+                job = await job_manager.submit(path, form["collection"], job_id=job_id, **options)
+            except Exception:
+                await asyncio.to_thread(job_manager.discard_upload, job_id)
+                raise
+        else:
+            request = JobRequest(**(await http_request.json()))
+            # Server-side paths are confined to JOB_IMPORT_DIR so jobs cannot read arbitrary container files
+            job = await job_manager.submit(job_manager.import_path(request.path), request.collection,
+                                           **request.model_dump(exclude={"path", "collection"}, exclude_none=True))
+        
+        logger.info(f"Started job {job.id}: {job.source} -> {job.collection}")
+        return job.get_status()
+    except HTTPException:
+        raise
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to create job: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/jobs")
+async def list_jobs():
+    """List bulk embedding jobs"""
+    return {"jobs": [job.get_status() for job in job_manager.jobs.values()]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get progress, throughput and ETA of a bulk embedding job"""
+    job = job_manager.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.get_status()
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a running bulk embedding job"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"status": "success", "message": f"Cancelling job: {job_id}"}
+
+@app.get("/collections")
+async def list_collections():
+    """List in-process vector collections"""
+    return {"collections": vector_store.get_stats()}
+
+@app.get("/collections/{name}")
+async def get_collection(name: str):
+    collection = vector_store.get(name)
+    if collection is None:
+        raise HTTPException(status_code=404, detail=f"Collection not found: {name}")
+    return collection.get_info()
+
+@app.post("/collections/{name}/add")
+async def add_to_collection(name: str, request: CollectionAddRequest):
+    """Embed texts (or take vectors) and insert them into a collection, creating it on first use"""
+    if (request.texts is None) == (request.vectors is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'texts' or 'vectors'")
+    count = len(request.texts if request.texts is not None else request.vectors)
+    if count == 0:
+        raise HTTPException(status_code=400, detail="Nothing to add: 'texts' or 'vectors' is empty")
+    if request.ids is not None and len(request.ids) != count:
+        raise HTTPException(status_code=400, detail="ids must match the number of inputs")
+    if request.payloads is not None and len(request.payloads) != count:
+        raise HTTPException(status_code=400, detail="payloads must match the number of inputs")
+    
+    collection = vector_store.get(name)
+    usage = None
+    try:
+        if request.texts is not None:
+            if collection is not None and collection.model is None:
+                raise HTTPException(status_code=400, detail=f"Collection {name} holds precomputed vectors only")
+            if collection is not None and request.model and request.model != collection.model:
+                raise HTTPException(status_code=400, detail=f"Collection {name} was built with {collection.model}")
+            entry = await model_manager.acquire(collection.model if collection else request.model)
+            result = await embed_texts(entry, request.texts, task_prefix(entry))
+            vectors = result.embeddings
+            model = entry.name
+            total_tokens = int(result.token_counts.sum())
+            usage = {"prompt_tokens": total_tokens, "total_tokens": total_tokens}
+        else:
+            vectors = np.asarray(request.vectors, dtype=np.float32)
+            if vectors.ndim != 2 or vectors.shape[1] == 0:
+                raise ValueError("'vectors' must be a non-empty list of equal-length vectors")
+            model = None
+        
+        # Look the collection up again: a concurrent add may have created it, or a delete dropped it, during the await
+        collection = vector_store.get(name)
+        if collection is not None and request.texts is not None and collection.model != model:
+            raise HTTPException(status_code=409, detail=f"Collection {name} was built with "
+                                                        f"{collection.model or 'precomputed vectors'}")
+        if collection is None:
+            collection = vector_store.create(name, vectors.shape[1], (request.dtype or "float32").lower(),
+                                             model=model, persist=bool(request.persist))
+            logger.info(f"Created collection {name} ({collection.dimension} dims, {collection.dtype})")
+        ids = request.ids or [uuid.uuid4().hex for _ in range(count)]
+        added, updated = collection.add(ids, vectors, request.payloads or [None] * count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"status": "success", "added": added, "updated": updated, "ids": ids,
+            "collection": collection.get_info(), "usage": usage}
+
+@app.post("/collections/{name}/search")
+async def search_collection(name: str, request: CollectionSearchRequest):
+    """Top-k cosine search for one or more queries, scored together in a single matmul"""
+    collection = vector_store.get(name)
+    if collection is None:
+        raise HTTPException(status_code=404, detail=f"Collection not found: {name}")
+    if (request.queries is None) == (request.vectors is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'queries' or 'vectors'")
+    
+    usage = None
+    if request.queries is not None:
+        if collection.model is None:
+            raise HTTPException(status_code=400, detail=f"Collection {name} holds precomputed vectors; search with 'vectors'")
+        queries = [request.queries] if isinstance(request.queries, str) else request.queries
+        entry = await model_manager.acquire(collection.model)
+        result = await embed_texts(entry, queries, task_prefix(entry, "query"))
+        vectors = result.embeddings
+        total_tokens = int(result.token_counts.sum())
+        usage = {"prompt_tokens": total_tokens, "total_tokens": total_tokens}
+    
+    try:
+        if request.queries is None:
+            vectors = np.asarray(request.vectors, dtype=np.float32)
+        indices, scores = collection.search(vectors, max(int(request.top_k or 10), 0))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    results = []
+    for row_indices, row_scores in zip(indices.tolist(), scores.tolist()):
+        hits = []
+        for index, score in zip(row_indices, row_scores):
+            hit = {"id": collection.ids[index], "score": score}
+            if request.include_payloads:
+                hit["payload"] = collection.payloads[index]
+            hits.append(hit)
+        results.append(hits)
+    return {"results": results, "collection": name, "model": collection.model, "usage": usage}
+
+@app.delete("/collections/{name}")
+async def delete_collection(name: str):
+    if not vector_store.drop(name):
+        raise HTTPException(status_code=404, detail=f"Collection not found: {name}")
+    return {"status": "success", "message": f"Deleted collection: {name}"}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return metrics_response()
+
 @app.get("/health")
 async def health():
     return {
@@ -165,81 +972,62 @@ async def health():
         "model": model_manager.current_model_name,
         "dimension": model_manager.model.get_sentence_embedding_dimension(),
         "max_length": model_manager.max_length,
-        "device": model_manager.device
+        "device": model_manager.device,
+        "switch": model_manager.switch_status["state"]
     }
 
 @app.get("/models")
 async def list_models():
-    """List available models (OpenAI compatible)"""
+    """List resident models (OpenAI compatible), active model first"""
+    names = [model_manager.current_model_name]
+    names += [name for name in model_manager.pool.names() if name != model_manager.current_model_name]
     return {
         "object": "list",
         "data": [
             {
-                "id": model_manager.current_model_name,
+                "id": name,
                 "object": "model",
                 "created": 1686935002,
                 "owned_by": "organization-owner"
             }
+            for name in names
         ]
     }
 
 @app.get("/model/info")
-async def get_model_info():
-    """Get detailed information about the current model"""
-    return model_manager.get_model_info()
+async def get_model_info(dimensions: Optional[int] = None):
+    """Get detailed information about the current model (int8 ranges for a truncated width if given)"""
+    return model_manager.get_model_info(dimensions)
 
 @app.get("/model/available")
 async def get_available_models():
     """Get list of available models that can be loaded"""
     models = []
     for name, info in model_manager.available_models.items():
-        # Check if model is cached locally
-        cache_path = Path(model_manager.cache_dir) / "hub"
-        model_folder = f"models--{name.replace('/', '--')}"
-        is_cached = (cache_path / model_folder).exists() if cache_path.exists() else False
-        
+        cached = model_inventory.get(name)
         models.append({
             "name": name,
             "dimensions": info["dimensions"],
             "max_length": info["max_length"],
+            "matryoshka_dims": info.get("matryoshka_dims"),
+            "prefixes": info.get("prefixes", {}),
             "active": name == model_manager.current_model_name,
-            "cached": is_cached,
-            "size": None  # Will be calculated if needed
+            "resident": name in model_manager.pool,
+            "cached": cached is not None,
+            "size": cached["size"] if cached else None
         })
     return {"models": models}
 
 @app.get("/model/cached")
 async def get_cached_models():
-    """Get list of models that are already downloaded/cached"""
-    cached_models = []
-    
-    # Check both possible cache locations
-    cache_paths = [
-        Path(model_manager.cache_dir) / "hub",  # Standard HF cache location
-        Path(model_manager.cache_dir)           # Alternative location
-    ]
-    
-    for cache_path in cache_paths:
-        if cache_path.exists():
-            for folder in cache_path.iterdir():
-                if folder.is_dir() and folder.name.startswith("models--"):
-                    model_name = folder.name.replace("models--", "").replace("--", "/")
-                    
-                    # Skip if we already found this model
-                    if any(m["name"] == model_name for m in cached_models):
-                        continue
-                    
-                    # Get folder size
-                    size = sum(f.stat().st_size for f in folder.rglob('*') if f.is_file())
-                    
-                    cached_models.append({
-                        "name": model_name,
-                        "path": str(folder),
-                        "size": size,
-                        "active": model_name == model_manager.current_model_name
-                    })
-    
-    return {"cached_models": cached_models}
+    """Get list of models that are already downloaded/cached (served from the inventory index)"""
+    return {
+        "cached_models": [
+            {**entry, "active": entry["name"] == model_manager.current_model_name}
+            for entry in model_inventory.models()
+        ],
+        "refreshed_at": model_inventory.refreshed_at
+    }
 
 @app.delete("/model/cache/{model_name:path}")
 async def delete_cached_model(model_name: str):
@@ -256,6 +1044,7 @@ async def delete_cached_model(model_name: str):
         if full_path.exists():
             import shutil
             shutil.rmtree(full_path)
+            model_inventory.forget(model_name)
             return {"status": "success", "message": f"Deleted cached model: {model_name}"}
         else:
             raise HTTPException(status_code=404, detail="Model not found in cache")
@@ -263,51 +1052,138 @@ async def delete_cached_model(model_name: str):
         logger.error(f"Failed to delete model: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def changed_settings(**requested) -> Dict[str, Any]:
+    """Load settings from a request that differ from the ones currently applied"""
+    return {
+        name: value for name, value in requested.items()
+        if value is not None and value != getattr(model_manager, name)
+    }
+
+async def begin_switch(model_name: str, settings: Dict[str, Any], wait: bool = False) -> Dict[str, Any]:
+    """Start a background switch (409 if one is running), optionally waiting for it to finish"""
+    if model_manager.switching:
+        raise HTTPException(
+            status_code=409,
+            detail=f"A switch to {model_manager.switch_status['model']} is already in progress"
+        )
+    task = model_manager.start_switch(model_name, settings)
+    if wait:
+        await task
+        if model_manager.switch_status["state"] == "failed":
+            raise HTTPException(status_code=500, detail=model_manager.switch_status["error"])
+    return model_manager.switch_status
+
 @app.post("/model/switch")
-async def switch_model(request: ModelSwitchRequest, background_tasks: BackgroundTasks):
-    """Switch to a different embedding model"""
-    try:
-        # Update settings if provided
-        if request.device:
-            model_manager.device = request.device
-        if request.max_length:
-            model_manager.max_length = request.max_length
-        if request.normalize is not None:
-            model_manager.normalize = request.normalize
-            
-        # Load the new model
-        model_manager.load_model(request.model_name)
-        
-        return {
-            "status": "success",
-            "message": f"Switched to model: {request.model_name}",
-            "model_info": model_manager.get_model_info()
-        }
-    except Exception as e:
-        logger.error(f"Failed to switch model: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+async def switch_model(request: ModelSwitchRequest):
+    """Switch to a different embedding model without blocking other requests.
+    
+    The model loads on a background thread while the current one keeps
+    serving. Poll /model/switch/status, or pass ``wait`` to block this call.
+    """
+    settings = changed_settings(
+        device=request.device or None,
+        max_length=request.max_length or None,
+        normalize=request.normalize
+    )
+    status = await begin_switch(request.model_name, settings, request.wait)
+    ready = status["state"] == "ready"
+    return {
+        "status": "success" if ready else "loading",
+        "message": f"{'Switched' if ready else 'Switching'} to model: {request.model_name}",
+        "switch": status,
+        "model_info": model_manager.get_model_info() if ready else None
+    }
+
+@app.get("/model/switch/status")
+async def get_switch_status():
+    """Progress of the most recent model switch or settings reload"""
+    return {
+        **model_manager.switch_status,
+        "active_model": model_manager.current_model_name,
+        "loading": dict(model_manager.pool.loading)
+    }
+
+@app.post("/model/warm")
+async def warm_model(request: ModelWarmRequest):
+    """Load a model into the pool in the background so a later switch is instant"""
+    if request.model_name in model_manager.pool:
+        return {"status": "resident", "model": request.model_name}
+    if model_manager.pool.loading.get(request.model_name) == "loading":
+        return {"status": "loading", "model": request.model_name}
+    
+    def on_loaded(future):
+        if future.exception():
+            logger.error(f"Warm load of {request.model_name} failed: {future.exception()}")
+        else:
+            model_inventory.request_refresh()  # the load may have downloaded the model
+    
+    model_manager.pool.loading[request.model_name] = "loading"
+    loop = asyncio.get_running_loop()
+    loop.run_in_executor(model_manager.loader, model_manager.warm_model, request.model_name).add_done_callback(on_loaded)
+    return {"status": "loading", "model": request.model_name}
+
+@app.post("/model/autotune")
+async def start_autotune():
+    """Benchmark thread counts and batch sizes for the active model and apply the fastest"""
+    if model_manager.autotuner.running:
+        raise HTTPException(status_code=409, detail="Autotune is already running")
+    model_manager.start_autotune()
+    return {"status": "running", "autotune": model_manager.autotuner.status}
+
+@app.get("/model/autotune")
+async def get_autotune():
+    """Autotune progress and the persisted result for the active model on this host"""
+    return model_manager.autotuner.get_info(model_manager.tuning_key(model_manager.active))
+
+@app.get("/model/pool")
+async def get_model_pool():
+    """Get resident models, memory use and in-progress loads"""
+    return model_manager.pool.get_stats()
 
 @app.post("/model/settings")
 async def update_model_settings(settings: ModelSettings):
-    """Update model settings"""
+    """Update model settings; changes that need a reload are applied by a background switch"""
     try:
-        if settings.device:
-            model_manager.device = settings.device
-        if settings.max_length:
-            model_manager.max_length = settings.max_length
-        if settings.normalize is not None:
-            model_manager.normalize = settings.normalize
-        if settings.cache_dir:
-            model_manager.cache_dir = settings.cache_dir
-            
-        # Reload model with new settings
-        model_manager.load_model()
+        quantization = settings.quantization.lower() if settings.quantization else None
+        if quantization and quantization not in QUANTIZATION_MODES:
+            raise HTTPException(status_code=400, detail=f"Unsupported quantization '{settings.quantization}'")
+        backend = settings.backend.lower() if settings.backend else None
+        if backend and backend not in BACKENDS:
+            raise HTTPException(status_code=400, detail=f"Unsupported backend '{settings.backend}'")
+        
+        # Output settings apply to the next request; load settings need the model rebuilt
+        if quantization:
+            model_manager.quantization = quantization
+        if settings.batch_size:
+            model_manager.batch_size = settings.batch_size
+            model_manager.scheduler.max_batch_size = settings.batch_size
+        if settings.max_batch_tokens:
+            model_manager.max_batch_tokens = settings.max_batch_tokens
+            model_manager.scheduler.token_budget = settings.max_batch_tokens
+        changes = changed_settings(
+            device=settings.device or None,
+            max_length=settings.max_length or None,
+            normalize=settings.normalize,
+            cache_dir=settings.cache_dir or None,
+            backend=backend,
+            onnx_quantize=settings.onnx_quantize,
+            onnx_threads=settings.onnx_threads
+        )
+        if not changes:
+            return {
+                "status": "success",
+                "message": "Settings updated",
+                "settings": model_manager.get_model_info()
+            }
         
+        status = await begin_switch(model_manager.current_model_name, changes)
         return {
-            "status": "success",
-            "message": "Settings updated",
-            "settings": model_manager.get_model_info()
+            "status": "loading",
+            "message": "Reloading model with new settings",
+            "switch": status
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to update settings: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -323,11 +1199,22 @@ async def root():
         "endpoints": {
             "/embeddings": "POST - Create embeddings (native)",
             "/v1/embeddings": "POST - Create embeddings (OpenAI compatible)",
+            "/v1/embeddings/stream": "POST - Stream NDJSON {id, text} lines to NDJSON embeddings",
+            "/jobs": "POST - Start a bulk embedding job into Qdrant",
+            "/jobs/{id}": "GET - Job progress, throughput and ETA",
             "/models": "GET - List available models",
             "/model/info": "GET - Get current model info",
             "/model/available": "GET - List available models",
+            "/collections": "GET - List in-process vector collections",
+            "/collections/{name}/add": "POST - Add texts or vectors to a collection",
+            "/collections/{name}/search": "POST - Top-k search for one or more queries",
+            "/model/autotune": "POST - Tune CPU threads and batch size for the active model",
             "/model/switch": "POST - Switch to different model",
+            "/model/switch/status": "GET - Progress of the current model switch",
+            "/model/warm": "POST - Load a model into the pool in the background",
+            "/model/pool": "GET - List resident models",
             "/model/settings": "POST - Update model settings",
+            "/metrics": "GET - Prometheus metrics",
             "/health": "GET - Health check"
         }
     }
\ No newline at end of file
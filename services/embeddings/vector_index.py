@@ -0,0 +1,262 @@
+"""
+In-process vector collections for the Embeddings Service
+Named float32/int8 matrices with batched brute-force top-k search and optional mmap persistence
+"""
+
+import json
+import logging
+import re
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_DTYPES = ("float32", "int8")
+
+# Must start with a letter or digit, so '.' and '..' can never name a directory
+COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+# Rows converted from int8 to float32 at a time during search
+SEARCH_BLOCK_ROWS = 65536
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row-wise top-k of a (queries, rows) score matrix, best first.
+
+    ``argpartition`` finds the k best in linear time; only those k are sorted.
+    """
+    queries, rows = scores.shape
+    k = min(k, rows)
+    if k <= 0:
+        return np.zeros((queries, 0), dtype=np.int64), np.zeros((queries, 0), dtype=np.float32)
+    if k < rows:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(rows), (queries, rows))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class VectorCollection:
+    """One named collection: a contiguous matrix of unit vectors plus ids and payloads.
+
+    Vectors are normalized on insert, so the dot product is the cosine
+    similarity. ``int8`` collections store each row scaled to [-127, 127]
+    with its own scale factor (4x smaller than float32). With a ``path``
+    the matrix lives in a memory-mapped ``.npy`` file and survives restarts.
+    """
+
+    def __init__(self, name: str, dimension: int, dtype: str = "float32", model: Optional[str] = None,
+                 path: Optional[Path] = None, capacity: int = 1024):
+        self.name = name
+        self.dimension = dimension
+        self.dtype = dtype
+        self.model = model
+        self.path = path
+        self.ids: List[str] = []
+        self.payloads: List[Optional[dict]] = []
+        self.positions: Dict[str, int] = {}
+        self.count = 0
+        self.vectors, self.scales = self._allocate(capacity)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.vectors)
+
+    def _allocate(self, capacity: int) -> Tuple[np.ndarray, np.ndarray]:
+        shape = (capacity, self.dimension)
+        if self.path is None:
+            return np.zeros(shape, dtype=self.dtype), np.ones(capacity, dtype=np.float32)
+        self.path.mkdir(parents=True, exist_ok=True)
+        vectors = np.lib.format.open_memmap(self.path / "vectors.tmp.npy", mode="w+", dtype=self.dtype, shape=shape)
+        scales = np.lib.format.open_memmap(self.path / "scales.tmp.npy", mode="w+", dtype=np.float32, shape=(capacity,))
+        return vectors, scales
+
+    def _grow(self, needed: int):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        vectors, scales = self._allocate(capacity)
+        vectors[:self.count] = self.vectors[:self.count]
+        scales[:self.count] = self.scales[:self.count]
+        self.vectors, self.scales = vectors, scales
+        if self.path is not None:
+            self._commit_files()
+
+    def _commit_files(self):
+        """Move freshly allocated memmaps into place (rename keeps the open mapping valid)"""
+        for stem in ("vectors", "scales"):
+            tmp = self.path / f"{stem}.tmp.npy"
+            if tmp.exists():
+                tmp.replace(self.path / f"{stem}.npy")
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        vectors = normalize_rows(vectors)
+        if self.dtype == "float32":
+            return vectors, np.ones(len(vectors), dtype=np.float32)
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        return np.rint(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def add(self, ids: List[str], vectors: np.ndarray, payloads: List[Optional[dict]]) -> Tuple[int, int]:
+        """Insert or overwrite rows by id; returns (added, updated)"""
+        if vectors.ndim != 2 or vectors.shape[1] != self.dimension:
+            raise ValueError(f"Collection '{self.name}' holds {self.dimension}-dimensional vectors")
+        rows, scales = self._encode(vectors)
+
+        # A repeated id within one call keeps its last occurrence
+        targets = np.empty(len(ids), dtype=np.int64)
+        added = 0
+        for i, point_id in enumerate(ids):
+            position = self.positions.get(point_id)
+            if position is None:
+                position = self.count + added
+                self.positions[point_id] = position
+                self.ids.append(point_id)
+                self.payloads.append(payloads[i])
+                added += 1
+            else:
+                self.payloads[position] = payloads[i]
+            targets[i] = position
+
+        if self.count + added > self.capacity:
+            self._grow(self.count + added)
+        self.vectors[targets] = rows
+        self.scales[targets] = scales
+        self.count += added
+        self.flush()
+        return added, len(ids) - added
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Score every query against every row in one matmul and return row indices and scores"""
+        if queries.ndim != 2 or queries.shape[1] != self.dimension:
+            raise ValueError(f"Collection '{self.name}' holds {self.dimension}-dimensional vectors")
+        queries = normalize_rows(queries)
+        count = self.count
+        if self.dtype == "float32":
+            scores = queries @ self.vectors[:count].T
+        else:
+            scores = np.empty((len(queries), count), dtype=np.float32)
+            for start in range(0, count, SEARCH_BLOCK_ROWS):
+                end = min(start + SEARCH_BLOCK_ROWS, count)
+                block = self.vectors[start:end].astype(np.float32)
+                scores[:, start:end] = (queries @ block.T) * self.scales[start:end]
+        return top_k(scores, k)
+
+    def flush(self):
+        """Persist ids, payloads and the memmapped matrix"""
+        if self.path is None:
+            return
+        self.vectors.flush()
+        self.scales.flush()
+        meta = self.path / "meta.json"
+        tmp = meta.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "name": self.name,
+            "dimension": self.dimension,
+            "dtype": self.dtype,
+            "model": self.model,
+            "count": self.count,
+            "ids": self.ids,
+            "payloads": self.payloads,
+        }))
+        tmp.replace(meta)
+
+    @classmethod
+    def load(cls, path: Path) -> "VectorCollection":
+        meta = json.loads((path / "meta.json").read_text())
+        collection = cls.__new__(cls)
+        collection.name = meta["name"]
+        collection.dimension = meta["dimension"]
+        collection.dtype = meta["dtype"]
+        collection.model = meta.get("model")
+        collection.path = path
+        collection.count = meta["count"]
+        collection.ids = meta["ids"]
+        collection.payloads = meta["payloads"]
+        collection.positions = {point_id: i for i, point_id in enumerate(collection.ids)}
+        collection.vectors = np.load(path / "vectors.npy", mmap_mode="r+")
+        collection.scales = np.load(path / "scales.npy", mmap_mode="r+")
+        return collection
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "count": self.count,
+            "dimension": self.dimension,
+            "dtype": self.dtype,
+            "model": self.model,
+            "persistent": self.path is not None,
+            "memory_mb": round((self.vectors[:self.count].nbytes + self.scales[:self.count].nbytes) / (1024 * 1024), 2),
+        }
+
+
+class CollectionStore:
+    """Named collections, with persistent ones kept under ``root``"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.collections: Dict[str, VectorCollection] = {}
+
+    def load_all(self):
+        """Reopen persisted collections (memory-mapped, so startup does not read them in)"""
+        if not self.root.exists():
+            return
+        for meta in sorted(self.root.glob("*/meta.json")):
+            try:
+                collection = VectorCollection.load(meta.parent)
+            except Exception as e:
+                logger.warning(f"Skipping unreadable collection {meta.parent}: {e}")
+                continue
+            self.collections[collection.name] = collection
+            logger.info(f"Loaded collection {collection.name} ({collection.count} vectors)")
+
+    def get(self, name: str) -> Optional[VectorCollection]:
+        return self.collections.get(name)
+
+    def collection_path(self, name: str) -> Path:
+        """Directory of a persisted collection; refuses anything that would resolve outside the root"""
+        path = self.root / name
+        if path.resolve().parent != self.root.resolve():
+            raise ValueError(f"Invalid collection name: {name}")
+        return path
+
+    def create(self, name: str, dimension: int, dtype: str = "float32", model: Optional[str] = None,
+               persist: bool = False) -> VectorCollection:
+        if not COLLECTION_NAME.match(name):
+            raise ValueError("Collection names must start with a letter or digit and may only contain "
+                             "letters, digits, '_', '.' and '-' (max 64)")
+        if dtype not in INDEX_DTYPES:
+            raise ValueError(f"dtype must be one of {list(INDEX_DTYPES)}")
+        if name in self.collections:
+            raise ValueError(f"Collection already exists: {name}")
+        collection = VectorCollection(name, dimension, dtype, model,
+                                      path=self.collection_path(name) if persist else None)
+        if persist:
+            collection._commit_files()
+        self.collections[name] = collection
+        return collection
+
+    def drop(self, name: str) -> bool:
+        collection = self.collections.pop(name, None)
+        if collection is None:
+            return False
+        if collection.path is not None:
+            try:
+                path = self.collection_path(collection.path.name)
+            except ValueError as e:
+                logger.error(f"Not deleting files of collection {name}: {e}")
+                return True
+            shutil.rmtree(path, ignore_errors=True)
+        return True
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [collection.get_info() for collection in self.collections.values()]
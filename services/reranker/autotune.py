@@ -0,0 +1,176 @@
+"""
+CPU thread and batch-size autotuning for inference services
+Benchmarks the loaded model over a small grid and persists the best setting per (model, host CPU)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import platform
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Deterministic filler text for synthetic inputs
+WORDS = (
+    "the model maps text into vectors so that related passages land close together while unrelated "
+    "ones stay apart which lets retrieval systems rank documents by meaning rather than exact wording"
+).split()
+
+
+def synthetic_texts(count: int, word_counts: List[int]) -> List[str]:
+    """``count`` texts cycling through representative lengths"""
+    texts = []
+    for i in range(count):
+        length = word_counts[i % len(word_counts)]
+        texts.append(" ".join(WORDS[(i + j) % len(WORDS)] for j in range(length)))
+    return texts
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def host_fingerprint() -> str:
+    """CPU model and usable core count; tuning results are only reused on a matching host"""
+    cpu = platform.processor() or platform.machine()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return f"{cpu} x{available_cpus()}"
+
+
+def thread_candidates(max_threads: int) -> List[int]:
+    """Powers of two up to the usable cores, plus the core count itself"""
+    candidates = []
+    threads = 1
+    while threads < max_threads:
+        candidates.append(threads)
+        threads *= 2
+    candidates.append(max_threads)
+    return candidates
+
+
+class Autotuner:
+    """Grid-search thread count and batch size, one measurement per executor job.
+
+    Each configuration is measured as a separate job on the service's encode
+    executor, so real requests interleave between measurements instead of
+    waiting for the whole sweep. Results are persisted in
+    ``cache_dir/autotune.json`` keyed by host fingerprint and model.
+    """
+
+    def __init__(self, cache_dir: str, max_seconds: float = 120.0, repeats: int = 2):
+        self.path = Path(cache_dir) / "autotune.json"
+        self.max_seconds = max_seconds
+        self.repeats = repeats
+        self.host = host_fingerprint()
+        self.status: Dict[str, Any] = {"state": "idle"}
+        self.task: Optional[asyncio.Task] = None
+        self._results = self._read()
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def lookup(self, model_name: str) -> Optional[Dict[str, Any]]:
+        """Persisted result for this model on this host"""
+        return self._results.get(self.host, {}).get(model_name)
+
+    def save(self, model_name: str, result: Dict[str, Any]):
+        self._results.setdefault(self.host, {})[model_name] = result
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self._results, indent=2))
+            tmp.replace(self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist autotune result: {e}")
+
+    def measure(self, run: Callable[[int], int], threads: int, batch: int) -> float:
+        """Items per second for one configuration (runs on the executor thread)"""
+        previous = torch.get_num_threads()
+        torch.set_num_threads(threads)
+        try:
+            run(batch)  # warm-up: allocator, kernels, thread pool
+            items = 0
+            started = time.perf_counter()
+            for _ in range(self.repeats):
+                items += run(batch)
+            return items / max(time.perf_counter() - started, 1e-9)
+        finally:
+            torch.set_num_threads(previous)
+
+    async def tune(self, model_name: str, run: Callable[[int], int], batches: List[int],
+                   executor, threads: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Sweep threads x batches, persist and return the fastest configuration.
+
+        ``run(batch)`` performs one representative workload with the given
+        batch setting and returns the number of items it processed.
+        """
+        loop = asyncio.get_running_loop()
+        threads = threads or thread_candidates(available_cpus())
+        grid = [(t, b) for t in threads for b in batches]
+        self.status = {"state": "running", "model": model_name, "done": 0, "total": len(grid),
+                       "started_at": time.time()}
+        started = time.perf_counter()
+        results = []
+        for thread_count, batch in grid:
+            if time.perf_counter() - started > self.max_seconds:
+                logger.warning(f"Autotune time budget reached after {len(results)}/{len(grid)} configurations")
+                break
+            throughput = await loop.run_in_executor(executor, self.measure, run, thread_count, batch)
+            results.append({"threads": thread_count, "batch": batch, "throughput": round(throughput, 2)})
+            self.status["done"] = len(results)
+
+        best = max(results, key=lambda r: r["throughput"])
+        result = {
+            "model": model_name,
+            "host": self.host,
+            "threads": best["threads"],
+            "batch": best["batch"],
+            "throughput": best["throughput"],
+            "results": results,
+            "seconds": round(time.perf_counter() - started, 1),
+            "tuned_at": time.time(),
+        }
+        self.save(model_name, result)
+        self.status = {"state": "done", "model": model_name, "finished_at": time.time()}
+        logger.info(f"Autotuned {model_name}: {best['threads']} threads, batch {best['batch']} "
+                    f"({best['throughput']} items/s)")
+        return result
+
+    def start(self, model_name: str, run: Callable[[int], int], batches: List[int], executor,
+              on_result: Callable[[Dict[str, Any]], None], threads: Optional[List[int]] = None) -> asyncio.Task:
+        """Run ``tune`` in the background and hand the result to ``on_result``"""
+        async def runner():
+            try:
+                on_result(await self.tune(model_name, run, batches, executor, threads))
+            except Exception as e:
+                logger.error(f"Autotune of {model_name} failed: {e}")
+                self.status = {"state": "failed", "model": model_name, "error": str(e)}
+
+        self.task = asyncio.create_task(runner())
+        return self.task
+
+    def get_info(self, model_name: str) -> Dict[str, Any]:
+        return {"host": self.host, "status": self.status, "result": self.lookup(model_name)}
@@ -0,0 +1,51 @@
+"""
+Two-stage cascade reranking for the Reranker Service
+A cheap prefilter scores every candidate; only the best survivors reach the large cross-encoder
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def bi_encoder_scores(model, query: str, documents: List[str], batch_size: int = 32) -> np.ndarray:
+    """Cosine similarity of each document embedding to the query embedding (runs on the scoring thread)"""
+    with torch.inference_mode():
+        vectors = model.encode([query] + documents, batch_size=batch_size, convert_to_numpy=True,
+                               normalize_embeddings=True, show_progress_bar=False)
+    return (vectors[1:] @ vectors[0]).astype(np.float32)
+
+
+class StageModels:
+    """Prefilter and alternate final-stage models, loaded once on first use and kept resident.
+
+    Concurrent first requests for the same model share one load.
+    """
+
+    def __init__(self, load_fn: Callable[[str, Dict[str, Any]], Any], executor):
+        self.load_fn = load_fn
+        self.executor = executor
+        self._models: Dict[str, asyncio.Future] = {}
+
+    async def get(self, model_name: str, info: Dict[str, Any]):
+        future = self._models.get(model_name)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            logger.info(f"Loading cascade stage model: {model_name}")
+            future = self._models[model_name] = loop.run_in_executor(self.executor, self.load_fn, model_name, info)
+        try:
+            return await future
+        except Exception:
+            self._models.pop(model_name, None)  # let a later request retry
+            raise
+
+    def loaded(self) -> List[str]:
+        return [name for name, future in self._models.items() if future.done() and not future.exception()]
+
+    def clear(self):
+        self._models.clear()
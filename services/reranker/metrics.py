@@ -0,0 +1,90 @@
+"""
+Prometheus metrics for the Reranker Service
+"""
+
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+TOKENS = Counter(
+    "reranker_prompt_tokens_total",
+    "Query+document pair tokens scored, counted from the model tokenizer",
+    ["model"]
+)
+PAIRS = Counter(
+    "reranker_pairs_total",
+    "Query+document pairs scored",
+    ["model"]
+)
+TRUNCATED = Counter(
+    "reranker_truncated_pairs_total",
+    "Query+document pairs truncated at the model's max length",
+    ["model"]
+)
+
+BATCH_SIZE = Histogram(
+    "reranker_batch_size",
+    "Query+document pairs per forward pass, pooled across requests",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+BATCH_TOKENS = Histogram(
+    "reranker_batch_tokens",
+    "Padded tokens per forward pass",
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+)
+QUEUE_WAIT = Histogram(
+    "reranker_queue_wait_seconds",
+    "Time from a request's arrival to its first pair entering a forward pass",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+EXPIRED = Counter(
+    "reranker_deadline_exceeded_total",
+    "Rerank requests failed because their deadline passed before all pairs were scored"
+)
+SCORE_CACHE_LOOKUPS = Counter(
+    "reranker_score_cache_lookups_total",
+    "Query+document score cache lookups by result",
+    ["result"]
+)
+SCORE_CACHE_HIT_RATIO = Gauge(
+    "reranker_score_cache_hit_ratio",
+    "Score cache hits divided by lookups since start"
+)
+
+
+def record_usage(model: str, scored):
+    """Count pairs and tokens scored by one request"""
+    PAIRS.labels(model).inc(len(scored.token_counts))
+    TOKENS.labels(model).inc(int(scored.token_counts.sum()))
+    truncated = int(scored.truncated.sum())
+    if truncated:
+        TRUNCATED.labels(model).inc(truncated)
+
+
+def observe_batch(pairs: int, padded_tokens: int):
+    """Record the shape of one forward pass"""
+    BATCH_SIZE.observe(pairs)
+    BATCH_TOKENS.observe(padded_tokens)
+
+
+def observe_queue_wait(seconds: float):
+    QUEUE_WAIT.observe(seconds)
+
+
+def record_expired():
+    EXPIRED.inc()
+
+
+def record_score_lookups(hits: int, misses: int):
+    if hits:
+        SCORE_CACHE_LOOKUPS.labels("hit").inc(hits)
+    if misses:
+        SCORE_CACHE_LOOKUPS.labels("miss").inc(misses)
+
+
+def bind_score_cache(cache):
+    """Read the hit ratio from the cache's own stats at scrape time"""
+    SCORE_CACHE_HIT_RATIO.set_function(lambda: cache.get_stats()["hit_rate"])
+
+
+def metrics_response() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
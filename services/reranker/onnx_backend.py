@@ -0,0 +1,181 @@
+"""
+ONNX Runtime inference backend for the Reranker Service
+Exports a CrossEncoder once, optionally int8-quantizes it, and serves it on a tuned session
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+# Query/document pairs for the torch-vs-ONNX parity check on load
+PARITY_QUERY = "how do vector databases find similar documents?"
+PARITY_DOCUMENTS = [
+    "Vector databases index embeddings and answer nearest-neighbour queries.",
+    "The recipe calls for two cups of flour and a pinch of salt.",
+    "a",
+    "Approximate nearest neighbour search trades exact recall for speed. " * 30,
+]
+
+
+def default_thread_count() -> int:
+    """CPUs this container may actually run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class _LogitsGraph(torch.nn.Module):
+    """Sequence classifier returning raw logits as one traceable module"""
+
+    def __init__(self, model, use_token_types: bool):
+        super().__init__()
+        self.model = model
+        self.use_token_types = use_token_types
+
+    def forward(self, input_ids, attention_mask, token_type_ids=None):
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if self.use_token_types:
+            inputs["token_type_ids"] = token_type_ids
+        return self.model(**inputs, return_dict=True).logits
+
+
+def export_onnx(model, path: Path, use_token_types: bool):
+    """Export a CrossEncoder's classifier (on CPU) to ONNX with dynamic batch and sequence axes"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    graph = _LogitsGraph(model.model, use_token_types).to("cpu").eval()
+    dummy = model.tokenizer(["export the reranker graph"], ["with a short passage"], return_tensors="pt")
+    names = ["input_ids", "attention_mask"] + (["token_type_ids"] if use_token_types else [])
+    logger.info(f"Exporting ONNX graph to {path}")
+    with torch.inference_mode():
+        torch.onnx.export(
+            graph,
+            tuple(dummy[name] for name in names),
+            str(path),
+            input_names=names,
+            output_names=["logits"],
+            dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in names}, "logits": {0: "batch"}},
+            opset_version=17,
+            do_constant_folding=True,
+        )
+
+
+def quantize_onnx(source: Path, target: Path):
+    """Dynamic int8 weight quantization of an exported graph"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    logger.info(f"Quantizing ONNX graph to int8: {target}")
+    quantize_dynamic(str(source), str(target), weight_type=QuantType.QInt8)
+
+
+class OnnxCrossEncoder:
+    """Serves an exported reranker graph with the CrossEncoder surface the pair scorer needs"""
+
+    def __init__(self, path: Path, tokenizer, max_length: int, activation: str, use_token_types: bool,
+                 backend: str = "onnx", threads: int = 0):
+        import onnxruntime as ort
+
+        self.path = path
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.activation = activation
+        self.use_token_types = use_token_types
+        self.threads = threads or default_thread_count()
+        self.nbytes = path.stat().st_size
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        providers = ["CPUExecutionProvider"]
+        if backend == "openvino":
+            if "OpenVINOExecutionProvider" in ort.get_available_providers():
+                providers.insert(0, ("OpenVINOExecutionProvider", {
+                    "device_type": "CPU",
+                    "num_of_threads": self.threads,
+                    "cache_dir": str(path.parent / "openvino_cache"),
+                }))
+            else:
+                logger.warning("OpenVINOExecutionProvider not available, using CPUExecutionProvider")
+
+        self.session = ort.InferenceSession(str(path), sess_options=options, providers=providers)
+        self.provider = self.session.get_providers()[0]
+        self.parity: Optional[Dict[str, Any]] = None
+        logger.info(f"ONNX session ready ({self.provider}, {self.threads} threads): {path}")
+
+    def forward_padded(self, input_ids: List[List[int]], token_type_ids: Optional[List[List[int]]] = None) -> np.ndarray:
+        """Pad one batch to its longest pair and return activated scores"""
+        features = {"input_ids": input_ids}
+        if self.use_token_types and token_type_ids is not None:
+            features["token_type_ids"] = token_type_ids
+        features = self.tokenizer.pad(features, padding="longest", return_tensors="np")
+        feeds = {name: features[name].astype(np.int64) for name in ("input_ids", "attention_mask")}
+        if self.use_token_types:
+            feeds["token_type_ids"] = (features["token_type_ids"].astype(np.int64) if "token_type_ids" in features
+                                       else np.zeros_like(feeds["input_ids"]))
+        logits = self.session.run(["logits"], feeds)[0].astype(np.float32, copy=False)
+        scores = 1 / (1 + np.exp(-logits)) if self.activation == "sigmoid" else logits
+        return scores[:, 0] if scores.shape[1] == 1 else scores
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "provider": self.provider,
+            "threads": self.threads,
+            "size_mb": round(self.nbytes / (1024 * 1024), 1),
+            "parity": self.parity,
+        }
+
+
+def build_onnx_cross_encoder(model, model_name: str, cache_dir: str, backend: str = "onnx",
+                             quantize: bool = False, threads: int = 0) -> OnnxCrossEncoder:
+    """Export (or reuse) the ONNX artifacts for a model under cache_dir and open a session"""
+    artifacts = Path(cache_dir) / "onnx" / model_name.replace("/", "--")
+    fp32_path = artifacts / "model.onnx"
+    int8_path = artifacts / "model.int8.onnx"
+    use_token_types = "token_type_ids" in model.tokenizer.model_input_names
+
+    if not fp32_path.exists():
+        export_onnx(model, fp32_path, use_token_types)
+        (artifacts / "export.json").write_text(json.dumps({
+            "model": model_name,
+            "type": "cross-encoder",
+            "num_labels": model.config.num_labels,
+            "token_type_ids": use_token_types,
+            "opset": 17,
+        }, indent=2))
+    if quantize and not int8_path.exists():
+        quantize_onnx(fp32_path, int8_path)
+
+    activation = "sigmoid" if isinstance(model.default_activation_function, torch.nn.Sigmoid) else "identity"
+    return OnnxCrossEncoder(
+        int8_path if quantize else fp32_path,
+        tokenizer=model.tokenizer,
+        max_length=model.max_length,
+        activation=activation,
+        use_token_types=use_token_types,
+        backend=backend,
+        threads=threads,
+    )
+
+
+def check_parity(reference: np.ndarray, candidate: np.ndarray, max_diff: float) -> Dict[str, Any]:
+    """Compare torch and ONNX pair scores; the ranking agreement is reported but near-ties may swap"""
+    diff = np.abs(reference - candidate)
+    same_order = bool(np.array_equal(np.argsort(-reference, kind="stable"), np.argsort(-candidate, kind="stable")))
+    return {
+        "max_abs_diff": round(float(diff.max()), 6),
+        "threshold": max_diff,
+        "same_ranking": same_order,
+        "passed": bool(diff.max() <= max_diff),
+    }
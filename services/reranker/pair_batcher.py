@@ -0,0 +1,263 @@
+"""
+Cross-request pair batching for the Reranker Service
+Pools (query, document) pairs from concurrent requests into token-budgeted forward passes
+"""
+
+import asyncio
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from metrics import observe_batch, observe_queue_wait, record_expired
+from pair_scorer import PairScorer, ScoredPairs, pool_passages
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    """A rerank request's pairs were not all scored before its deadline"""
+
+
+class _PendingRerank:
+    """One request's tokenized pairs, dispatched shortest first, and the scores gathered so far"""
+
+    __slots__ = ("model", "input_ids", "token_type_ids", "lengths", "truncated", "order", "cursor",
+                 "scores", "remaining", "future", "queued_at", "deadline")
+
+    def __init__(self, model, input_ids: List[List[int]], token_type_ids: Optional[List[List[int]]],
+                 truncated: np.ndarray, future: asyncio.Future, queued_at: float, deadline: Optional[float]):
+        self.model = model
+        self.input_ids = input_ids
+        self.token_type_ids = token_type_ids
+        self.lengths = np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(input_ids))
+        self.truncated = truncated
+        self.order = np.argsort(self.lengths, kind="stable")
+        self.cursor = 0
+        self.scores = np.zeros(len(input_ids), dtype=np.float32)
+        self.remaining = len(input_ids)
+        self.future = future
+        self.queued_at = queued_at
+        self.deadline = deadline
+
+    @property
+    def priority(self) -> Tuple[float, float]:
+        """Earliest deadline first; requests without one follow in arrival order"""
+        return (self.deadline if self.deadline is not None else math.inf, self.queued_at)
+
+    @property
+    def undispatched(self) -> int:
+        return len(self.order) - self.cursor
+
+
+class RerankBatcher:
+    """Score pairs from concurrent rerank requests in shared forward passes.
+
+    Each request is tokenized on the scoring thread and its pairs join a
+    shared pool. A single worker task builds every forward pass from that
+    pool: at most ``scorer.batch_size`` pairs whose padded size
+    (pairs x longest pair) fits ``max_batch_tokens``. Every waiting request
+    gets an equal share of each pass, so a 1000-document request cannot hold
+    the model while small ones queue behind it. Leftover room goes to
+    requests in earliest-deadline order. A request whose deadline passes is
+    failed with ``DeadlineExceeded`` and its unscored pairs are dropped.
+    Requests keep the model they were submitted with, so a model switch
+    never splits one.
+    """
+
+    def __init__(self, scorer: PairScorer, max_batch_tokens: int = 16384, max_wait_ms: float = 2.0):
+        self.scorer = scorer
+        self.max_batch_tokens = max_batch_tokens
+        self.max_wait_ms = max_wait_ms
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="score")
+        self._active: List[_PendingRerank] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Future] = set()
+        self.stats = {"requests": 0, "batches": 0, "pairs": 0, "tokens": 0, "padded_tokens": 0, "expired": 0}
+
+    async def start(self):
+        """Start the background worker on the running event loop"""
+        if self._worker is None:
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+            logger.info(f"Rerank batcher started (max_batch_tokens={self.max_batch_tokens}, "
+                        f"max_wait_ms={self.max_wait_ms})")
+
+    async def stop(self):
+        """Stop the worker and release the scoring thread"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, model, query: str, documents: List[str], timeout: Optional[float] = None) -> ScoredPairs:
+        """Tokenize the pairs, queue them and wait until every pair is scored.
+
+        ``timeout`` (seconds) sets the request's deadline; it also moves the
+        request ahead of ones with later or no deadlines.
+        """
+        await self.start()
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        input_ids, token_type_ids, truncated = await loop.run_in_executor(
+            self.executor, self.scorer.tokenize, model, query, documents
+        )
+        return await self._enqueue(model, input_ids, token_type_ids, truncated, queued_at, timeout)
+
+    async def submit_passages(self, model, query: str, documents: List[str], pooling: str = "max",
+                              overlap: int = 64, timeout: Optional[float] = None) -> ScoredPairs:
+        """Score every passage of every document, then pool the passage scores per document.
+
+        Passages from all documents join the pool as separate pairs, so they
+        are dispatched shortest first like any other request's pairs.
+        """
+        await self.start()
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        input_ids, token_type_ids, truncated, owners = await loop.run_in_executor(
+            self.executor, self.scorer.tokenize_passages, model, query, documents, overlap
+        )
+        scored = await self._enqueue(model, input_ids, token_type_ids, truncated, queued_at, timeout)
+        return pool_passages(scored, owners, len(documents), pooling)
+
+    async def _enqueue(self, model, input_ids: List[List[int]], token_type_ids: Optional[List[List[int]]],
+                       truncated: np.ndarray, queued_at: float, timeout: Optional[float]) -> ScoredPairs:
+        loop = asyncio.get_running_loop()
+        deadline = queued_at + timeout if timeout else None
+        future = loop.create_future()
+        request = _PendingRerank(model, input_ids, token_type_ids, truncated, future, queued_at, deadline)
+        self.stats["requests"] += 1
+        if not input_ids:
+            return ScoredPairs(request.scores, request.lengths, truncated)
+
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        self._active.append(request)
+        self._wakeup.set()
+        return await future
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait for every request submitted so far to finish; later submissions are not waited on"""
+        pending = [future for future in self._pending if not future.done()]
+        if not pending:
+            return True
+        _, still_pending = await asyncio.wait(pending, timeout=timeout)
+        return not still_pending
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Report batching configuration and counters"""
+        batches = self.stats["batches"]
+        padded = self.stats["padded_tokens"]
+        return {
+            "max_batch_size": self.scorer.batch_size,
+            "max_batch_tokens": self.max_batch_tokens,
+            "max_wait_ms": self.max_wait_ms,
+            "active_requests": len(self._active),
+            "queued_pairs": sum(request.undispatched for request in self._active),
+            **self.stats,
+            "avg_batch_size": round(self.stats["pairs"] / batches, 2) if batches else 0,
+            "padding_efficiency": round(self.stats["tokens"] / padded, 4) if padded else 1.0,
+        }
+
+    def _expire(self, now: float):
+        """Fail requests past their deadline and drop callers that went away"""
+        live = []
+        for request in self._active:
+            if not request.future.done() and request.deadline is not None and now > request.deadline:
+                request.future.set_exception(DeadlineExceeded(
+                    f"{request.remaining} of {len(request.order)} pairs unscored at the deadline"
+                ))
+                self.stats["expired"] += 1
+                record_expired()
+            if not request.future.done():
+                live.append(request)
+        self._active = live
+
+    def _plan(self, now: float) -> List[Tuple[_PendingRerank, int]]:
+        """Pick the (request, pair index) entries of the next forward pass"""
+        waiting = sorted((r for r in self._active if r.undispatched), key=lambda r: r.priority)
+        if not waiting:
+            return []
+        model = waiting[0].model
+        waiting = [request for request in waiting if request.model is model]
+        capacity = max(1, self.scorer.batch_size)
+        picked: List[Tuple[_PendingRerank, int]] = []
+        longest = 0
+
+        def take(request: _PendingRerank, limit: int, ceiling: float = math.inf):
+            nonlocal longest
+            if request.cursor == 0 and request.undispatched:
+                observe_queue_wait(now - request.queued_at)
+            taken = 0
+            while taken < limit and request.undispatched and len(picked) < capacity:
+                index = int(request.order[request.cursor])
+                length = int(request.lengths[index])
+                # Pairs are dispatched shortest first, so once one overflows the budget the rest would too
+                if length > ceiling or (picked and (len(picked) + 1) * max(longest, length) > self.max_batch_tokens):
+                    return
+                longest = max(longest, length)
+                picked.append((request, index))
+                request.cursor += 1
+                taken += 1
+
+        share = max(1, capacity // len(waiting))
+        for request in waiting:
+            take(request, share)
+        # Fill leftover room only with pairs that do not lengthen the pass, so short pairs are not padded to long ones
+        for request in waiting:
+            take(request, capacity, ceiling=longest)
+        return picked
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not any(request.undispatched for request in self._active):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                # Give callers arriving together a moment to join the first pass
+                if self.max_wait_ms > 0:
+                    await asyncio.sleep(self.max_wait_ms / 1000)
+
+            self._expire(loop.time())
+            picked = self._plan(loop.time())
+            if not picked:
+                continue
+
+            model = picked[0][0].model
+            input_ids = [request.input_ids[index] for request, index in picked]
+            token_type_ids = None
+            if picked[0][0].token_type_ids is not None:
+                token_type_ids = [request.token_type_ids[index] for request, index in picked]
+            try:
+                scores = await loop.run_in_executor(self.executor, self.scorer.forward, model,
+                                                    input_ids, token_type_ids)
+            except Exception as e:
+                logger.error(f"Rerank forward pass failed for {len(picked)} pair(s): {e}")
+                for request in {id(request): request for request, _ in picked}.values():
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                self._active = [request for request in self._active if not request.future.done()]
+                continue
+
+            tokens = sum(len(ids) for ids in input_ids)
+            padded = len(input_ids) * max(len(ids) for ids in input_ids)
+            self.stats["batches"] += 1
+            self.stats["pairs"] += len(picked)
+            self.stats["tokens"] += tokens
+            self.stats["padded_tokens"] += padded
+            observe_batch(len(picked), padded)
+
+            # Hand each request its scores; finished ones resolve as soon as their last pair is back
+            for (request, index), score in zip(picked, scores):
+                request.scores[index] = score
+                request.remaining -= 1
+                if request.remaining == 0 and not request.future.done():
+                    request.future.set_result(ScoredPairs(request.scores, request.lengths, request.truncated))
+            self._active = [request for request in self._active if request.remaining and not request.future.done()]
@@ -0,0 +1,164 @@
+"""
+Cross-encoder pair scoring for the Reranker Service
+Tokenizes the query once, builds pair inputs directly and keeps exact token accounting
+Long documents can be split into overlapping passages whose scores are pooled per document
+"""
+
+import logging
+from typing import List, Tuple
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class ScoredPairs:
+    """Scores for (query, document) pairs plus per-pair token accounting"""
+
+    __slots__ = ("scores", "token_counts", "truncated")
+
+    def __init__(self, scores: np.ndarray, token_counts: np.ndarray, truncated: np.ndarray):
+        self.scores = scores
+        self.token_counts = token_counts
+        self.truncated = truncated
+
+
+def truncate_pair(query_len: int, doc_len: int, limit: int) -> Tuple[int, int]:
+    """Lengths kept by HF's longest_first strategy: trim the longer side until the pair fits"""
+    if query_len + doc_len <= limit:
+        return query_len, doc_len
+    shorter = min(query_len, doc_len)
+    if shorter <= limit // 2:
+        return (query_len, limit - query_len) if query_len == shorter else (limit - doc_len, doc_len)
+    query_keep = (limit + 1) // 2  # ties are trimmed from the second sequence first
+    return query_keep, limit - query_keep
+
+
+def plan_windows(length: int, size: int, overlap: int) -> List[Tuple[int, int]]:
+    """Token spans of overlapping windows covering ``length`` tokens (one window if it fits)"""
+    stride = max(1, size - overlap)
+    windows = []
+    start = 0
+    while True:
+        end = min(start + size, length)
+        windows.append((start, end))
+        if end >= length:
+            return windows
+        start += stride
+
+
+POOLING_MODES = ("max", "mean")
+
+
+def pool_passages(scored: ScoredPairs, owners: np.ndarray, count: int, pooling: str = "max") -> ScoredPairs:
+    """Collapse passage scores to one score per document; token counts add up over the passages.
+
+    ``owners`` maps each passage to its document and is non-decreasing, and
+    every document has at least one passage.
+    """
+    starts = np.searchsorted(owners, np.arange(count))
+    if pooling == "mean":
+        scores = np.add.reduceat(scored.scores, starts) / np.diff(np.append(starts, len(owners)))
+    else:
+        scores = np.maximum.reduceat(scored.scores, starts)
+    token_counts = np.add.reduceat(scored.token_counts, starts)
+    truncated = np.logical_or.reduceat(scored.truncated, starts)
+    return ScoredPairs(scores.astype(np.float32), token_counts, truncated)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first (ties keep input order).
+
+    ``argpartition`` finds the k best in linear time; only those k are sorted.
+    """
+    k = min(k, len(scores))
+    if k < len(scores):
+        candidates = np.sort(np.argpartition(-scores, k - 1)[:k])
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class PairScorer:
+    """Run a CrossEncoder over pre-tokenized pairs in fixed-size batches"""
+
+    def __init__(self, batch_size: int = 32):
+        self.batch_size = batch_size
+
+    def tokenize(self, model, query: str, documents: List[str]):
+        """Tokenize the query once and each document once; return model-ready pair inputs"""
+        tokenizer = model.tokenizer
+        limit = model.max_length - tokenizer.num_special_tokens_to_add(pair=True)
+        query_ids = tokenizer(query, add_special_tokens=False)["input_ids"]
+        doc_ids = tokenizer(documents, add_special_tokens=False, return_attention_mask=False)["input_ids"]
+        use_token_types = "token_type_ids" in tokenizer.model_input_names
+
+        input_ids, token_type_ids = [], []
+        truncated = np.zeros(len(documents), dtype=bool)
+        for i, ids in enumerate(doc_ids):
+            query_keep, doc_keep = truncate_pair(len(query_ids), len(ids), limit)
+            truncated[i] = doc_keep < len(ids) or query_keep < len(query_ids)
+            first, second = query_ids[:query_keep], ids[:doc_keep]
+            input_ids.append(tokenizer.build_inputs_with_special_tokens(first, second))
+            if use_token_types:
+                token_type_ids.append(tokenizer.create_token_type_ids_from_sequences(first, second))
+        return input_ids, (token_type_ids if use_token_types else None), truncated
+
+    def tokenize_passages(self, model, query: str, documents: List[str], overlap: int = 64):
+        """Split each document into overlapping passages that fit beside the query.
+
+        The query keeps at most half the pair budget; each document is cut
+        into windows of the remaining length, so no document text is lost.
+        Returns model-ready pair inputs, truncation flags (set only when the
+        query itself was cut) and the owning document of each passage.
+        """
+        tokenizer = model.tokenizer
+        limit = model.max_length - tokenizer.num_special_tokens_to_add(pair=True)
+        query_ids = tokenizer(query, add_special_tokens=False)["input_ids"]
+        query_cut = len(query_ids) > limit // 2
+        query_ids = query_ids[:limit // 2]
+        size = limit - len(query_ids)
+        doc_ids = tokenizer(documents, add_special_tokens=False, return_attention_mask=False)["input_ids"]
+        use_token_types = "token_type_ids" in tokenizer.model_input_names
+
+        input_ids, token_type_ids, owners = [], [], []
+        for owner, ids in enumerate(doc_ids):
+            for start, end in plan_windows(len(ids), size, min(overlap, size - 1)):
+                input_ids.append(tokenizer.build_inputs_with_special_tokens(query_ids, ids[start:end]))
+                if use_token_types:
+                    token_type_ids.append(tokenizer.create_token_type_ids_from_sequences(query_ids, ids[start:end]))
+                owners.append(owner)
+        truncated = np.full(len(input_ids), query_cut, dtype=bool)
+        return (input_ids, (token_type_ids if use_token_types else None), truncated,
+                np.asarray(owners, dtype=np.int64))
+
+    def forward(self, model, input_ids: List[List[int]], token_type_ids=None) -> np.ndarray:
+        """Pad one batch to its longest pair and return activated scores"""
+        if hasattr(model, "forward_padded"):  # ONNX Runtime backend
+            return model.forward_padded(input_ids, token_type_ids)
+        features = {"input_ids": input_ids}
+        if token_type_ids is not None:
+            features["token_type_ids"] = token_type_ids
+        features = model.tokenizer.pad(features, padding="longest", return_tensors="pt")
+        features = {name: tensor.to(model.model.device) for name, tensor in features.items()}
+        with torch.inference_mode():
+            logits = model.model(**features, return_dict=True).logits
+            scores = model.default_activation_function(logits)
+        scores = scores.float().cpu().numpy()
+        return scores[:, 0] if scores.shape[1] == 1 else scores
+
+    def score(self, model, query: str, documents: List[str]) -> ScoredPairs:
+        """Score every (query, document) pair"""
+        input_ids, token_type_ids, truncated = self.tokenize(model, query, documents)
+        token_counts = np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(input_ids))
+        batches = []
+        for start in range(0, len(input_ids), self.batch_size):
+            end = start + self.batch_size
+            batches.append(self.forward(
+                model,
+                input_ids[start:end],
+                token_type_ids[start:end] if token_type_ids is not None else None
+            ))
+        scores = np.concatenate(batches) if batches else np.zeros(0, dtype=np.float32)
+        return ScoredPairs(scores, token_counts, truncated)
@@ -0,0 +1,98 @@
+"""
+Query-document score cache for the Reranker Service
+Bounded in-memory LRU of pair scores keyed by model, max length, scoring mode and content hashes of both texts
+"""
+
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class CachedScore(tuple):
+    """(score, token_count, truncated) for one scored pair"""
+
+    __slots__ = ()
+
+    def __new__(cls, score: float, token_count: int, truncated: bool):
+        return super().__new__(cls, (score, token_count, truncated))
+
+    @property
+    def score(self) -> float:
+        return self[0]
+
+    @property
+    def token_count(self) -> int:
+        return self[1]
+
+    @property
+    def truncated(self) -> bool:
+        return self[2]
+
+
+class ScoreCache:
+    """LRU of pair scores; a score depends only on the model, its max length and the two texts"""
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self.enabled = max_entries > 0
+        self._entries: "OrderedDict[tuple, CachedScore]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def keys(self, model_name: str, max_length: int, query: str, documents: List[str],
+             mode: str = "truncate") -> List[tuple]:
+        """Cache keys for every pair of one request; the query is hashed once.
+
+        ``mode`` separates truncated pair scores from pooled passage scores.
+        """
+        query_digest = text_digest(query)
+        return [(model_name, max_length, mode, query_digest, text_digest(doc)) for doc in documents]
+
+    def get_many(self, keys: List[tuple]) -> List[Optional[CachedScore]]:
+        """Look up pairs in order; misses are returned as None"""
+        if not self.enabled:
+            self.stats["misses"] += len(keys)
+            return [None] * len(keys)
+        results = []
+        for key in keys:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+            results.append(cached)
+        hits = sum(1 for cached in results if cached is not None)
+        self.stats["hits"] += hits
+        self.stats["misses"] += len(keys) - hits
+        return results
+
+    def put_many(self, keys: List[tuple], scores, token_counts, truncated):
+        """Store freshly scored pairs (one row per key)"""
+        if not self.enabled:
+            return
+        for key, score, count, flag in zip(keys, scores.tolist(), token_counts.tolist(), truncated.tolist()):
+            self._entries[key] = CachedScore(score, count, flag)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        """Drop every cached score, e.g. after a model or settings change"""
+        self._entries.clear()
+        logger.info("Score cache invalidated")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Report hit rate, size and evictions"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
@@ -1,14 +1,27 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from pydantic import BaseModel
-from sentence_transformers import CrossEncoder
+from sentence_transformers import CrossEncoder, SentenceTransformer
 import os
 import json
-from typing import List, Optional, Union, Dict
+from typing import Any, List, Optional, Union, Dict, Tuple
 import logging
 import torch
+import numpy as np
 from pathlib import Path
 from datetime import datetime
 import shutil
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import bind_score_cache, metrics_response, record_score_lookups, record_usage
+from model_inventory import ModelInventory
+from autotune import Autotuner, synthetic_texts
+from pair_scorer import POOLING_MODES, PairScorer, ScoredPairs, top_k as top_k_indices
+from pair_batcher import DeadlineExceeded, RerankBatcher
+from cascade import StageModels, bi_encoder_scores
+from onnx_backend import BACKENDS, PARITY_DOCUMENTS, PARITY_QUERY, build_onnx_cross_encoder, check_parity
+from score_cache import ScoreCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,7 +35,21 @@ class ModelManager:
         self.max_length = int(os.environ.get("MAX_LENGTH", "512"))
         self.device = os.environ.get("DEVICE", "cpu")
         self.cache_dir = os.environ.get("CACHE_DIR", "/home/ucadmin/.cache/huggingface")
+        self.batch_size = int(os.environ.get("BATCH_SIZE", "32"))
+        self.max_batch_tokens = int(os.environ.get("MAX_BATCH_TOKENS", "16384"))
+        self.max_batch_wait_ms = float(os.environ.get("MAX_BATCH_WAIT_MS", "2"))
+        self.request_timeout_ms = int(os.environ.get("RERANK_TIMEOUT_MS", "0"))
+        self.backend = os.environ.get("BACKEND", "torch").lower()
+        self.onnx_quantize = os.environ.get("ONNX_QUANTIZE", "false").lower() == "true"
+        self.onnx_threads = int(os.environ.get("ONNX_THREADS", "0"))
         self.model = None
+        self.scorer = PairScorer(batch_size=self.batch_size)
+        self.loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-load")
+        self.switch_status: Dict[str, Any] = {"state": "idle"}
+        self.switch_task: Optional[asyncio.Task] = None
+        self.autotune_on_start = os.environ.get("AUTOTUNE", "false").lower() == "true"
+        self.torch_threads = torch.get_num_threads()  # what the scoring worker runs with; tuning updates it
+        self.autotuner = Autotuner(self.cache_dir, max_seconds=float(os.environ.get("AUTOTUNE_MAX_SECONDS", "120")))
         self.available_models = {
             "mixedbread-ai/mxbai-rerank-large-v1": {"max_length": 512, "type": "cross-encoder"},
             "mixedbread-ai/mxbai-rerank-base-v1": {"max_length": 512, "type": "cross-encoder"},
@@ -31,70 +58,374 @@ class ModelManager:
             "BAAI/bge-reranker-base": {"max_length": 512, "type": "cross-encoder"},
             "cross-encoder/ms-marco-MiniLM-L-6-v2": {"max_length": 512, "type": "cross-encoder"},
             "cross-encoder/ms-marco-MiniLM-L-12-v2": {"max_length": 512, "type": "cross-encoder"},
+            # Cascade prefilters only: scored by embedding cosine, not as pairs
+            "BAAI/bge-small-en-v1.5": {"max_length": 512, "type": "bi-encoder"},
+            "sentence-transformers/all-MiniLM-L6-v2": {"max_length": 256, "type": "bi-encoder"},
         }
+        self.cascade_model = os.environ.get("CASCADE_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        self.cascade_candidates = int(os.environ.get("CASCADE_CANDIDATES", "50"))
+        self.stage_models = StageModels(self._load_stage, self.loader)
         self.load_model()
         
-    def load_model(self, model_name: Optional[str] = None):
-        """Load or switch to a different model"""
-        if model_name:
-            self.current_model_name = model_name
-            
-        logger.info(f"Loading reranker model: {self.current_model_name}")
-        logger.info(f"Device: {self.device}, Max length: {self.max_length}")
+    def _load(self, model_name: str, device: str, max_length: int, backend: Optional[str] = None,
+              onnx_quantize: Optional[bool] = None, onnx_threads: Optional[int] = None):
+        """Load a model from disk without touching the one currently serving"""
+        logger.info(f"Loading reranker model: {model_name}")
+        logger.info(f"Device: {device}, Max length: {max_length}")
         
         # Initialize model with trust_remote_code for compatibility
         try:
-            self.model = CrossEncoder(
-                self.current_model_name,
-                max_length=self.max_length,
-                device=self.device,
+            model = CrossEncoder(
+                model_name,
+                max_length=max_length,
+                device=device,
                 trust_remote_code=True
             )
             logger.info("Model loaded successfully")
         except Exception as e:
             logger.warning(f"Failed to load with trust_remote_code: {e}")
             # Fallback to standard loading
-            self.model = CrossEncoder(
-                self.current_model_name, 
-                max_length=self.max_length, 
-                device=self.device
+            model = CrossEncoder(
+                model_name, 
+                max_length=max_length, 
+                device=device
             )
             logger.info("Model loaded successfully (standard mode)")
+        
+        backend = backend or self.backend
+        if backend != "torch":
+            if device != "cpu":
+                logger.warning(f"The {backend} backend runs on CPU only; serving {model_name} with torch on {device}")
+            else:
+                model = self._load_onnx(
+                    model_name, model, backend,
+                    self.onnx_quantize if onnx_quantize is None else onnx_quantize,
+                    self.onnx_threads if onnx_threads is None else onnx_threads
+                )
+        return model
+        
+    def _load_onnx(self, model_name: str, torch_model: CrossEncoder, backend: str, quantize: bool, threads: int):
+        """Swap a loaded torch cross-encoder for its ONNX Runtime export, keeping torch if parity fails"""
+        try:
+            encoder = build_onnx_cross_encoder(
+                torch_model, model_name, self.cache_dir, backend=backend, quantize=quantize, threads=threads
+            )
+            scorer = PairScorer(batch_size=len(PARITY_DOCUMENTS))
+            reference = scorer.score(torch_model, PARITY_QUERY, PARITY_DOCUMENTS).scores
+            candidate = scorer.score(encoder, PARITY_QUERY, PARITY_DOCUMENTS).scores
+            encoder.parity = check_parity(reference, candidate, 0.05 if quantize else 1e-3)
+        except Exception as e:
+            logger.error(f"ONNX backend unavailable for {model_name}, serving with torch: {e}")
+            return torch_model
+        
+        if not encoder.parity["passed"]:
+            logger.error(f"ONNX parity check failed for {model_name} "
+                         f"(max score difference {encoder.parity['max_abs_diff']}), serving with torch")
+            return torch_model
+        logger.info(f"ONNX parity check passed for {model_name} "
+                    f"(max score difference {encoder.parity['max_abs_diff']})")
+        return encoder
+        
+    def _load_stage(self, model_name: str, info: Dict[str, Any]):
+        """Load a cascade stage model with the service's device and the model's own max length"""
+        if info["type"] == "bi-encoder":
+            model = SentenceTransformer(model_name, device=self.device, cache_folder=self.cache_dir)
+            model.max_seq_length = info["max_length"]
+            return model
+        return self._load(model_name, self.device, info["max_length"])
+        
+    async def get_stage_model(self, model_name: str):
+        """The serving model, or a resident cascade stage model from available_models"""
+        if model_name == self.current_model_name:
+            return self.model, "cross-encoder"
+        info = self.available_models.get(model_name)
+        if info is None:
+            raise HTTPException(status_code=400, detail=f"Unknown cascade model: {model_name}")
+        return await self.stage_models.get(model_name, info), info["type"]
+        
+    def load_model(self, model_name: Optional[str] = None):
+        """Load or switch to a different model (blocking; used at startup)"""
+        if model_name:
+            self.current_model_name = model_name
+        self.model = self._load(self.current_model_name, self.device, self.max_length)
+        
+    @property
+    def switching(self) -> bool:
+        return self.switch_task is not None and not self.switch_task.done()
+        
+    def start_switch(self, model_name: str, settings: Dict[str, Any]) -> asyncio.Task:
+        """Begin loading a model in the background; the current one serves until it is ready"""
+        self.switch_status = {
+            "state": "loading",
+            "model": model_name,
+            "previous_model": self.current_model_name,
+            "settings": settings,
+            "started_at": time.time(),
+        }
+        self.switch_task = asyncio.create_task(self._switch(model_name, settings, self.switch_status))
+        return self.switch_task
+        
+    async def _switch(self, model_name: str, settings: Dict[str, Any], status: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            model = await loop.run_in_executor(
+                self.loader, self._load, model_name,
+                settings.get("device", self.device), settings.get("max_length", self.max_length),
+                settings.get("backend"), settings.get("onnx_quantize"), settings.get("onnx_threads")
+            )
+            status["load_seconds"] = round(time.perf_counter() - started, 2)
             
+            # Queued requests keep the model they were submitted with, so this swap never splits one
+            for name, value in settings.items():
+                setattr(self, name, value)
+            self.model = model
+            self.current_model_name = model_name
+            score_cache.clear()
+            if settings:
+                # Cascade stage models were built with the old device/backend; reload them on next use
+                self.stage_models.clear()
+            model_inventory.request_refresh()  # the load may have downloaded a model
+            self.apply_stored_tuning()
+            status["state"] = "ready"
+            logger.info(f"Switched to model: {model_name}")
+        except Exception as e:
+            logger.error(f"Failed to switch to {model_name}, still serving {self.current_model_name}: {e}")
+            status["state"] = "failed"
+            status["error"] = str(e)
+        status["finished_at"] = time.time()
+            
+    def backend_info(self):
+        """Configured backend and what the current model is actually served with"""
+        model = self.model
+        info = {"configured": self.backend, "active": "onnx" if hasattr(model, "forward_padded") else "torch"}
+        if hasattr(model, "get_info"):
+            info.update(model.get_info(), quantized=self.onnx_quantize)
+        return info
+        
+    def tuning_key(self) -> str:
+        """Tuning results depend on the runtime, so torch and ONNX are tuned separately"""
+        return f"{self.current_model_name} ({'onnx' if hasattr(self.model, 'forward_padded') else 'torch'})"
+        
+    def apply_tuning(self, result: Dict[str, Any]):
+        """Apply a tuned thread count and pair batch size if they were measured for the current model"""
+        if result.get("model") != self.tuning_key():
+            return
+        if not hasattr(self.model, "forward_padded"):  # ONNX sessions keep their own thread pool
+            # The thread count is per thread, so set it on the scoring worker that serves requests
+            batcher.executor.submit(torch.set_num_threads, result["threads"])
+            self.torch_threads = result["threads"]
+        self.batch_size = result["batch"]
+        self.scorer.batch_size = result["batch"]
+        logger.info(f"Applied tuning: {result['threads']} threads, batch size {result['batch']}")
+        
+    def apply_stored_tuning(self) -> bool:
+        result = self.autotuner.lookup(self.tuning_key())
+        if result:
+            self.apply_tuning(result)
+        return result is not None
+        
+    def start_autotune(self) -> asyncio.Task:
+        """Benchmark the current model over thread counts and batch sizes on synthetic query/passage pairs"""
+        model = self.model
+        query = synthetic_texts(1, [12])[0]
+        documents = synthetic_texts(64, [32, 96, 192, 320])  # snippets through full passages
+        
+        def run(batch_size: int) -> int:
+            PairScorer(batch_size).score(model, query, documents)
+            return len(documents)
+        
+        onnx = hasattr(model, "forward_padded")
+        # Sweep on the scoring thread so measurements never compete with live traffic for cores
+        return self.autotuner.start(self.tuning_key(), run, [8, 16, 32, 64, 128], batcher.executor,
+                                    on_result=self.apply_tuning, threads=[torch.get_num_threads()] if onnx else None)
+        
     def get_model_info(self):
         """Get information about the current model"""
         return {
             "name": self.current_model_name,
             "max_length": self.max_length,
             "device": self.device,
+            "batch_size": self.batch_size,
+            "max_batch_tokens": self.max_batch_tokens,
+            "batching": batcher.get_stats(),
+            "score_cache": score_cache.get_stats(),
+            "threads": self.torch_threads,
+            "backend": self.backend_info(),
+            "autotune": self.autotuner.get_info(self.tuning_key()),
+            "cascade": {
+                "model": self.cascade_model,
+                "candidates": self.cascade_candidates,
+                "loaded": self.stage_models.loaded()
+            },
             "type": "cross-encoder"
         }
 
 # Initialize model manager
 model_manager = ModelManager()
 
+# Pools pairs from concurrent requests into shared forward passes on one scoring thread
+batcher = RerankBatcher(
+    model_manager.scorer,
+    max_batch_tokens=model_manager.max_batch_tokens,
+    max_wait_ms=model_manager.max_batch_wait_ms
+)
+
+# Scores of recently seen (query, document) pairs; only misses reach the model
+score_cache = ScoreCache(max_entries=int(os.environ.get("SCORE_CACHE_SIZE", "100000")))
+bind_score_cache(score_cache)
+
+# Index of the HF cache for /model/cached and /model/available
+model_inventory = ModelInventory(
+    model_manager.cache_dir,
+    refresh_interval=float(os.environ.get("MODEL_INVENTORY_REFRESH_SECONDS", "30"))
+)
+
+@app.on_event("startup")
+async def start_inventory():
+    await batcher.start()
+    await model_inventory.start()
+    if not model_manager.apply_stored_tuning() and model_manager.autotune_on_start:
+        model_manager.start_autotune()
+
+@app.on_event("shutdown")
+async def stop_inventory():
+    await model_inventory.stop()
+    await batcher.stop()
+
+class CascadeOptions(BaseModel):
+    model: Optional[str] = None  # prefilter: a cross-encoder or bi-encoder from /model/available (default CASCADE_MODEL)
+    candidates: Optional[int] = None  # survivors passed to the final stage (default CASCADE_CANDIDATES)
+    final_model: Optional[str] = None  # final cross-encoder (default the serving model)
+
 class RerankRequest(BaseModel):
     query: str
     documents: List[str]
     top_k: Optional[int] = 10
     model: Optional[str] = None
     return_documents: Optional[bool] = True
+    timeout_ms: Optional[int] = None  # fail with 504 if not scored in time (default RERANK_TIMEOUT_MS)
+    cascade: Optional[CascadeOptions] = None  # prefilter with a cheap model, rerank the survivors
+    long_documents: Optional[str] = "truncate"  # "max" or "mean" scores every passage and pools per document
+    passage_overlap: Optional[int] = 64  # tokens shared by consecutive passages
     
 class ModelSwitchRequest(BaseModel):
     model_name: str
     device: Optional[str] = None
     max_length: Optional[int] = None
+    wait: Optional[bool] = False  # respond only once the new model is serving
     
 class ModelSettings(BaseModel):
     device: Optional[str] = None
     max_length: Optional[int] = None
     batch_size: Optional[int] = None
+    max_batch_tokens: Optional[int] = None  # padded tokens per forward pass
     cache_dir: Optional[str] = None
+    backend: Optional[str] = None  # torch, onnx or openvino
+    onnx_quantize: Optional[bool] = None
+    onnx_threads: Optional[int] = None
 
 class RerankResponse(BaseModel):
     results: List[dict]
     model: str
     usage: Optional[dict] = None
+    cascade: Optional[dict] = None
+
+async def score_pairs(model_name: str, model, query: str, documents: List[str], timeout: Optional[float],
+                      passages: Optional[Tuple[str, int]] = None) -> ScoredPairs:
+    """Score pairs through the score cache and the batcher, returning scores and token accounting in order.
+    
+    ``passages`` is (pooling, overlap): long documents are split into passages
+    and each document gets the pooled score of its passages.
+    """
+    mode = "truncate" if passages is None else f"{passages[0]}:{passages[1]}"
+    keys = score_cache.keys(model_name, model.max_length, query, documents, mode)
+    cached = score_cache.get_many(keys)
+    scores = np.empty(len(documents), dtype=np.float32)
+    token_counts = np.zeros(len(documents), dtype=np.int64)
+    truncated = np.zeros(len(documents), dtype=bool)
+    
+    # Deduplicate misses so each unique document is scored once
+    miss_positions: Dict[tuple, List[int]] = {}
+    for i, hit in enumerate(cached):
+        if hit is None:
+            miss_positions.setdefault(keys[i], []).append(i)
+        else:
+            scores[i] = hit.score
+            token_counts[i] = hit.token_count
+            truncated[i] = hit.truncated
+    misses = sum(1 for hit in cached if hit is None)
+    record_score_lookups(len(cached) - misses, misses)
+    
+    if miss_positions:
+        miss_keys = list(miss_positions)
+        miss_documents = [documents[miss_positions[key][0]] for key in miss_keys]
+        if passages is None:
+            fresh = await batcher.submit(model, query, miss_documents, timeout=timeout)
+        else:
+            fresh = await batcher.submit_passages(model, query, miss_documents, pooling=passages[0],
+                                                  overlap=passages[1], timeout=timeout)
+        score_cache.put_many(miss_keys, fresh.scores, fresh.token_counts, fresh.truncated)
+        record_usage(model_name, fresh)  # pairs the model actually ran
+        
+        # Merge the fresh scores back into request order
+        for j, key in enumerate(miss_keys):
+            positions = miss_positions[key]
+            scores[positions] = fresh.scores[j]
+            token_counts[positions] = fresh.token_counts[j]
+            truncated[positions] = fresh.truncated[j]
+    
+    return ScoredPairs(scores, token_counts, truncated)
+
+async def score_stage(model_name: str, query: str, documents: List[str], timeout: Optional[float],
+                      passages: Optional[Tuple[str, int]] = None):
+    """Score documents with one cascade stage; returns its scores, pair accounting (if any) and timing"""
+    started = time.perf_counter()
+    model, model_type = await model_manager.get_stage_model(model_name)
+    if model_type == "bi-encoder":
+        loop = asyncio.get_running_loop()
+        scores = await loop.run_in_executor(batcher.executor, bi_encoder_scores, model, query, documents,
+                                            model_manager.batch_size)
+        scored = None
+    else:
+        scored = await score_pairs(model_name, model, query, documents, timeout, passages)
+        scores = scored.scores
+    stage = {"model": model_name, "type": model_type, "documents": len(documents),
+             "seconds": round(time.perf_counter() - started, 4)}
+    return scores, scored, stage
+
+async def rerank_cascade(request: RerankRequest, top_k: int, timeout: Optional[float],
+                         passages: Optional[Tuple[str, int]] = None):
+    """Prefilter every document with a cheap model, then rerank the top survivors with the final model.
+    
+    Passage pooling, if requested, applies to the final stage only.
+
+    Returns the original indices of the survivors, the final stage's ScoredPairs
+    for them, the pair tokens scored across stages and the per-stage report.
+    """
+    options = request.cascade
+    prefilter = options.model or model_manager.cascade_model
+    final = options.final_model or model_manager.current_model_name
+    candidates = max(options.candidates or model_manager.cascade_candidates, top_k)
+    if model_manager.available_models.get(final, {}).get("type") == "bi-encoder":
+        raise HTTPException(status_code=400, detail=f"{final} cannot be the final cascade stage")
+    stages = []
+    tokens = 0
+    survivors = np.arange(len(request.documents))
+    
+    if len(request.documents) > candidates:
+        scores, scored, stage = await score_stage(prefilter, request.query, request.documents, timeout)
+        stages.append(stage)
+        if scored is not None:
+            tokens += int(scored.token_counts.sum())
+        survivors = np.sort(top_k_indices(scores, candidates))
+    
+    documents = [request.documents[i] for i in survivors.tolist()]
+    _, scored, stage = await score_stage(final, request.query, documents, timeout, passages)
+    stages.append(stage)
+    tokens += int(scored.token_counts.sum())
+    report = {"final_model": final, "candidates": candidates, "survivors": len(survivors), "stages": stages}
+    return survivors, scored, tokens, report
 
 @app.post("/rerank")
 @app.post("/v1/rerank")  # OpenAI compatible endpoint
@@ -102,65 +433,91 @@ async def rerank(request: RerankRequest):
     """Rerank documents based on relevance to query"""
     try:
         if not request.documents:
-            return RerankResponse(results=[], model=request.model or model_manager.current_model_name)
+            final_model = request.cascade.final_model if request.cascade else None
+            return RerankResponse(results=[], model=final_model or request.model or model_manager.current_model_name)
         
         logger.info(f"Reranking {len(request.documents)} documents")
         
-        # Prepare pairs for scoring
-        pairs = [[request.query, doc] for doc in request.documents]
-        
-        # Get scores with progress tracking for large batches
-        if len(pairs) > 100:
-            logger.info(f"Processing large batch of {len(pairs)} pairs...")
-        
-        scores = model_manager.model.predict(pairs, show_progress_bar=False)
+        # Tokenize the query once and score every pair; token counts come from the same pass
+        if len(request.documents) > 100:
+            logger.info(f"Processing large batch of {len(request.documents)} pairs...")
         
-        # Create indexed results
-        indexed_results = [
-            {
-                "index": i,
-                "score": float(score),
-                "document": doc if request.return_documents else None
-            }
-            for i, (doc, score) in enumerate(zip(request.documents, scores))
-        ]
-        
-        # Sort by score (descending)
-        indexed_results.sort(key=lambda x: x['score'], reverse=True)
-        
-        # Get top_k results
-        top_results = indexed_results[:request.top_k] if request.top_k else indexed_results
+        # Scored on the scoring thread, in forward passes shared with concurrent requests
+        timeout_ms = request.timeout_ms or model_manager.request_timeout_ms
+        timeout = timeout_ms / 1000 if timeout_ms else None
+        top_k = request.top_k or len(request.documents)
+        long_documents = (request.long_documents or "truncate").lower()
+        if long_documents not in ("truncate",) + POOLING_MODES:
+            raise HTTPException(status_code=400,
+                                detail=f"long_documents must be one of {['truncate', *POOLING_MODES]}")
+        passages = None
+        if long_documents != "truncate":
+            passages = (long_documents, max(0, request.passage_overlap or 0))
+        cascade = None
+        if request.cascade:
+            positions, scored, total_tokens, cascade = await rerank_cascade(request, top_k, timeout, passages)
+        else:
+            scored = await score_pairs(model_manager.current_model_name, model_manager.model,
+                                       request.query, request.documents, timeout, passages)
+            positions = None
+            total_tokens = int(scored.token_counts.sum())
         
-        # Clean up results (remove None documents if not returning)
-        if not request.return_documents:
-            for result in top_results:
-                result.pop('document', None)
+        # Select the top_k on the score array; result objects and document copies exist only for those
+        top = top_k_indices(scored.scores, top_k)
+        flagged = scored.truncated[top].tolist()
+        indices = (positions[top] if positions is not None else top).tolist()
+        top_results = []
+        for index, score, truncated in zip(indices, scored.scores[top].tolist(), flagged):
+            result = {"index": index, "score": score}
+            if request.return_documents:
+                result["document"] = request.documents[index]
+            if truncated:
+                result["truncated"] = True
+            top_results.append(result)
         
         logger.info(f"Reranking complete. Top score: {top_results[0]['score'] if top_results else 0}")
         
-        # Estimate token usage
-        total_tokens = sum(len(doc.split()) + len(request.query.split()) for doc in request.documents) * 1.3
+        truncated_count = int(scored.truncated.sum())
+        if truncated_count:
+            logger.warning(f"{truncated_count} of {len(request.documents)} pairs truncated at {model_manager.max_length} tokens")
+        
+        usage = {
+            "prompt_tokens": total_tokens,
+            "total_tokens": total_tokens
+        }
+        if truncated_count:
+            usage["truncated_inputs"] = truncated_count
         
         return RerankResponse(
             results=top_results,
-            model=request.model or model_manager.current_model_name,
-            usage={
-                "prompt_tokens": int(total_tokens),
-                "total_tokens": int(total_tokens)
-            }
+            # With a cascade, the final stage's model produced the returned scores
+            model=cascade["final_model"] if cascade else request.model or model_manager.current_model_name,
+            usage=usage,
+            cascade=cascade
         )
         
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        logger.warning(f"Rerank deadline exceeded: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error in reranking: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return metrics_response()
+
 @app.get("/health")
 async def health():
     return {
         "status": "healthy",
         "model": model_manager.current_model_name,
         "device": model_manager.device,
-        "max_length": model_manager.max_length
+        "max_length": model_manager.max_length,
+        "switch": model_manager.switch_status["state"]
     }
 
 @app.get("/models")
@@ -188,52 +545,27 @@ async def get_available_models():
     """Get list of available models that can be loaded"""
     models = []
     for name, info in model_manager.available_models.items():
-        # Check if model is cached locally
-        cache_path = Path(model_manager.cache_dir) / "hub"
-        model_folder = f"models--{name.replace('/', '--')}"
-        is_cached = (cache_path / model_folder).exists() if cache_path.exists() else False
-        
+        cached = model_inventory.get(name)
         models.append({
             "name": name,
             "max_length": info["max_length"],
             "type": info["type"],
             "active": name == model_manager.current_model_name,
-            "cached": is_cached
+            "cached": cached is not None,
+            "size": cached["size"] if cached else None
         })
     return {"models": models}
 
 @app.get("/model/cached")
 async def get_cached_models():
-    """Get list of models that are already downloaded/cached"""
-    cached_models = []
-    
-    # Check both possible cache locations
-    cache_paths = [
-        Path(model_manager.cache_dir) / "hub",  # Standard HF cache location
-        Path(model_manager.cache_dir)           # Alternative location
-    ]
-    
-    for cache_path in cache_paths:
-        if cache_path.exists():
-            for folder in cache_path.iterdir():
-                if folder.is_dir() and folder.name.startswith("models--"):
-                    model_name = folder.name.replace("models--", "").replace("--", "/")
-                    
-                    # Skip if we already found this model
-                    if any(m["name"] == model_name for m in cached_models):
-                        continue
-                    
-                    # Get folder size
-                    size = sum(f.stat().st_size for f in folder.rglob('*') if f.is_file())
-                    
-                    cached_models.append({
-                        "name": model_name,
-                        "path": str(folder),
-                        "size": size,
-                        "active": model_name == model_manager.current_model_name
-                    })
-    
-    return {"cached_models": cached_models}
+    """Get list of models that are already downloaded/cached (served from the inventory index)"""
+    return {
+        "cached_models": [
+            {**entry, "active": entry["name"] == model_manager.current_model_name}
+            for entry in model_inventory.models()
+        ],
+        "refreshed_at": model_inventory.refreshed_at
+    }
 
 @app.delete("/model/cache/{model_name:path}")
 async def delete_cached_model(model_name: str):
@@ -249,6 +581,7 @@ async def delete_cached_model(model_name: str):
         
         if full_path.exists():
             shutil.rmtree(full_path)
+            model_inventory.forget(model_name)
             return {"status": "success", "message": f"Deleted cached model: {model_name}"}
         else:
             raise HTTPException(status_code=404, detail="Model not found in cache")
@@ -256,50 +589,98 @@ async def delete_cached_model(model_name: str):
         logger.error(f"Failed to delete model: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def begin_switch(model_name: str, settings: Dict[str, Any], wait: bool = False) -> Dict[str, Any]:
+    """Start a background switch (409 if one is running), optionally waiting for it to finish"""
+    if model_manager.switching:
+        raise HTTPException(
+            status_code=409,
+            detail=f"A switch to {model_manager.switch_status['model']} is already in progress"
+        )
+    task = model_manager.start_switch(model_name, settings)
+    if wait:
+        await task
+        if model_manager.switch_status["state"] == "failed":
+            raise HTTPException(status_code=500, detail=model_manager.switch_status["error"])
+    return model_manager.switch_status
+
 @app.post("/model/switch")
-async def switch_model(request: ModelSwitchRequest, background_tasks: BackgroundTasks):
-    """Switch to a different reranker model"""
-    try:
-        # Update settings if provided
-        if request.device:
-            model_manager.device = request.device
-        if request.max_length:
-            model_manager.max_length = request.max_length
-            
-        # Load the new model
-        model_manager.load_model(request.model_name)
-        
-        return {
-            "status": "success",
-            "message": f"Switched to model: {request.model_name}",
-            "model_info": model_manager.get_model_info()
-        }
-    except Exception as e:
-        logger.error(f"Failed to switch model: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+async def switch_model(request: ModelSwitchRequest):
+    """Switch to a different reranker model without blocking other requests"""
+    if model_manager.available_models.get(request.model_name, {}).get("type") == "bi-encoder":
+        raise HTTPException(status_code=400, detail=f"{request.model_name} can only serve as a cascade prefilter")
+    settings = {}
+    if request.device:
+        settings["device"] = request.device
+    if request.max_length:
+        settings["max_length"] = request.max_length
+    
+    status = await begin_switch(request.model_name, settings, request.wait)
+    ready = status["state"] == "ready"
+    return {
+        "status": "success" if ready else "loading",
+        "message": f"{'Switched' if ready else 'Switching'} to model: {request.model_name}",
+        "switch": status,
+        "model_info": model_manager.get_model_info() if ready else None
+    }
+
+@app.post("/model/autotune")
+async def start_autotune():
+    """Benchmark thread counts and batch sizes for the current model and apply the fastest"""
+    if model_manager.autotuner.running:
+        raise HTTPException(status_code=409, detail="Autotune is already running")
+    model_manager.start_autotune()
+    return {"status": "running", "autotune": model_manager.autotuner.status}
+
+@app.get("/model/autotune")
+async def get_autotune():
+    """Autotune progress and the persisted result for the current model on this host"""
+    return model_manager.autotuner.get_info(model_manager.tuning_key())
+
+@app.get("/model/switch/status")
+async def get_switch_status():
+    """Progress of the most recent model switch or settings reload"""
+    return {**model_manager.switch_status, "active_model": model_manager.current_model_name}
 
 @app.post("/model/settings")
 async def update_model_settings(settings: ModelSettings):
-    """Update model settings"""
-    try:
-        if settings.device:
-            model_manager.device = settings.device
-        if settings.max_length:
-            model_manager.max_length = settings.max_length
-        if settings.cache_dir:
-            model_manager.cache_dir = settings.cache_dir
-            
-        # Reload model with new settings
-        model_manager.load_model()
-        
+    """Update model settings; device, max_length and backend changes reload the model in the background"""
+    backend = settings.backend.lower() if settings.backend else None
+    if backend and backend not in BACKENDS:
+        raise HTTPException(status_code=400, detail=f"Unsupported backend '{settings.backend}'")
+    if settings.cache_dir:
+        model_manager.cache_dir = settings.cache_dir
+        model_inventory.set_cache_dir(settings.cache_dir)
+    if settings.batch_size:
+        model_manager.batch_size = settings.batch_size
+        model_manager.scorer.batch_size = settings.batch_size
+    if settings.max_batch_tokens:
+        model_manager.max_batch_tokens = settings.max_batch_tokens
+        batcher.max_batch_tokens = settings.max_batch_tokens
+    
+    changes = {}
+    if settings.device and settings.device != model_manager.device:
+        changes["device"] = settings.device
+    if settings.max_length and settings.max_length != model_manager.max_length:
+        changes["max_length"] = settings.max_length
+    if backend and backend != model_manager.backend:
+        changes["backend"] = backend
+    if settings.onnx_quantize is not None and settings.onnx_quantize != model_manager.onnx_quantize:
+        changes["onnx_quantize"] = settings.onnx_quantize
+    if settings.onnx_threads is not None and settings.onnx_threads != model_manager.onnx_threads:
+        changes["onnx_threads"] = settings.onnx_threads
+    if not changes:
         return {
             "status": "success",
             "message": "Settings updated",
             "settings": model_manager.get_model_info()
         }
-    except Exception as e:
-        logger.error(f"Failed to update settings: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    
+    status = await begin_switch(model_manager.current_model_name, changes)
+    return {
+        "status": "loading",
+        "message": "Reloading model with new settings",
+        "switch": status
+    }
 
 @app.get("/")
 async def root():
@@ -314,8 +695,11 @@ async def root():
             "/models": "GET - List available models",
             "/model/info": "GET - Get current model info",
             "/model/available": "GET - List available models",
+            "/model/autotune": "POST - Tune CPU threads and batch size for the current model",
             "/model/switch": "POST - Switch to different model",
+            "/model/switch/status": "GET - Progress of the current model switch",
             "/model/settings": "POST - Update model settings",
+            "/metrics": "GET - Prometheus metrics",
             "/health": "GET - Health check"
         }
     }